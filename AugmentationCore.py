@@ -0,0 +1,401 @@
+import os
+import zlib
+import itertools
+import collections
+import concurrent.futures
+import cv2
+import numpy as np
+from FileScanner import IMAGE_EXTENSIONS, scan_files
+from JobManifest import JobManifest
+from JobControl import check, spawn_context
+from ImageEncoding import DEFAULT_ENCODING
+from ShardWriter import ShardFormat, ShardWriter
+from Instrumentation import NULL_STATS, RunStats
+
+
+def image_seed(seed, image_file, variant=None):
+    """Derive a reproducible per-image seed from the run seed, the image file name and the variant number."""
+    if seed is None:
+        return None  # Fresh OS entropy for every image
+    entropy = [int(seed), zlib.crc32(image_file.encode("utf-8"))]
+    return entropy if variant is None else entropy + [variant]
+
+
+def output_name(image_file, variant=None, encoding=None):
+    """Name of the augmented file: aug_<name>, or aug_<stem>_v<variant><ext> when making several variants.
+
+    Images from sub-folders keep their sub-folder, e.g. cats/aug_001.jpg. The extension is
+    the one encoding (an ImageEncoding) writes, the source's own by default.
+    """
+    folder, name = os.path.split(image_file)
+    stem, ext = os.path.splitext(name)
+    ext = (encoding or DEFAULT_ENCODING).extension(ext)
+    if variant is None:
+        return os.path.join(folder, f"aug_{stem}{ext}")
+    return os.path.join(folder, f"aug_{stem}_v{variant}{ext}")
+
+
+def write_output(output_path, image_file, variant, img, stats=NULL_STATS, encoding=None):
+    """Write one augmented image, creating its sub-folder under output_path if needed. Returns False on failure.
+
+    When output_path is a ShardFormat nothing is written; the image is packed and returned
+    as (output name, payload) for a ShardWriter in the main process instead, or False if it
+    could not be encoded.
+    """
+    if isinstance(output_path, ShardFormat):
+        name = output_name(image_file, variant, encoding)
+        try:
+            with stats.timer("pack"):
+                return name, output_path.pack(img, os.path.splitext(name)[1], encoding)
+        except (ValueError, cv2.error):
+            return False
+    output_file = os.path.join(output_path, output_name(image_file, variant, encoding))
+    if "/" in image_file:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with stats.timer("imwrite"):
+        ok = (encoding or DEFAULT_ENCODING).write(output_file, img)
+    if ok and stats.enabled:
+        stats.count("bytes_written", os.path.getsize(output_file))
+    return ok
+
+
+def _written(outputs):
+    """ok for the write_output results of one image: the packed outputs when sharding, else whether all were written.
+
+    An image with any output that failed is not ok, and none of its packed outputs are kept.
+    """
+    if not all(outputs):
+        return False
+    return outputs if isinstance(outputs[0], tuple) else True
+
+
+def read_image(path, stats=NULL_STATS):
+    """cv2.imread, timed into stats. Returns None if the image could not be read."""
+    with stats.timer("imread"):
+        img = cv2.imread(path)
+    if img is not None and stats.enabled:
+        stats.count("bytes_read", os.path.getsize(path))
+    return img
+
+
+def variant_numbers(variants):
+    """Variant numbers for variants outputs per image. A single output keeps the plain aug_<name>."""
+    return [None] if variants <= 1 else range(variants)
+
+
+def build_affine_matrix(width, height, rotation=0, flip_lr=False, flip_tb=False, zoom_factor=1.0, shear_factor=0.0):
+    """Compose rotation, flips, zoom and shear (applied in that order) into a single 2x3 matrix."""
+    M = np.eye(3)
+
+    # 1. Rotation about the image centre
+    if rotation:
+        M = np.vstack([cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1), [0, 0, 1]]) @ M
+
+    # 2. Horizontal flip
+    if flip_lr:
+        M = np.array([[-1, 0, width - 1], [0, 1, 0], [0, 0, 1]]) @ M
+
+    # 3. Vertical flip
+    if flip_tb:
+        M = np.array([[1, 0, 0], [0, -1, height - 1], [0, 0, 1]]) @ M
+
+    # 4. Zoom, the same mapping as cropping the centre and resizing back to full size
+    if zoom_factor != 1:
+        new_height, new_width = max(1, int(height * zoom_factor)), max(1, int(width * zoom_factor))
+        x0, y0 = int((width - new_width) / 2), int((height - new_height) / 2)
+        scale_x, scale_y = width / new_width, height / new_height
+        M = np.array([[scale_x, 0, (0.5 - x0) * scale_x - 0.5],
+                      [0, scale_y, (0.5 - y0) * scale_y - 0.5],
+                      [0, 0, 1]]) @ M
+
+    # 5. Horizontal shear
+    if shear_factor:
+        M = np.array([[1, shear_factor, 0], [0, 1, 0], [0, 0, 1]]) @ M
+
+    return M[:2]
+
+
+def apply_affine(img, M):
+    """Resample img once through the 2x3 matrix M. Identity and pure flips skip the warp."""
+    height, width = img.shape[:2]
+    linear, translation = M[:, :2], M[:, 2]
+
+    if np.allclose(np.abs(linear), np.eye(2)):
+        flip_x, flip_y = linear[0, 0] < 0, linear[1, 1] < 0
+        expected = [width - 1 if flip_x else 0, height - 1 if flip_y else 0]
+        if np.allclose(translation, expected):
+            if not flip_x and not flip_y:
+                return img
+            # flipCode: 1 horizontal, 0 vertical, -1 both
+            return cv2.flip(img, -1 if flip_x and flip_y else int(flip_x))
+
+    return cv2.warpAffine(img, M, (width, height))
+
+
+def apply_augmentation(img, rotation, flip_lr, flip_tb, zoom, shear, probability, rng=None):
+    """Apply OpenCV-based augmentations with a single resample."""
+    if rng is None:
+        rng = np.random.default_rng()
+    height, width = img.shape[:2]
+
+    # Draw every random decision first, in the same order as the individual steps
+    rotate = rng.choice([0, rotation], p=[1 - probability, probability])  # randomness from user parameter
+    do_flip_lr = flip_lr == "Yes" and rng.choice([0, 1], p=[1 - probability, probability])
+    do_flip_tb = flip_tb == "Yes" and rng.choice([0, 1], p=[1 - probability, probability])
+    zoom_factor = 1 - zoom  # Zoom factor (less than 1 for zooming in)
+    do_zoom = rng.choice([0, zoom_factor], p=[1 - probability, probability])
+    do_shear = rng.choice([0, zoom_factor], p=[1 - probability, probability])
+
+    M = build_affine_matrix(width, height,
+                            rotation=rotation if rotate else 0,
+                            flip_lr=bool(do_flip_lr),
+                            flip_tb=bool(do_flip_tb),
+                            zoom_factor=zoom_factor if do_zoom else 1.0,
+                            shear_factor=shear / 100.0 if do_shear else 0.0)
+    return apply_affine(img, M)
+
+
+def preview_augmentation(img, rotation, flip_lr, flip_tb, zoom, shear):
+    """Apply every augmentation unconditionally, as shown in the live preview."""
+    height, width = img.shape[:2]
+    M = build_affine_matrix(width, height,
+                            rotation=rotation,
+                            flip_lr=flip_lr == "Yes",
+                            flip_tb=flip_tb == "Yes",
+                            zoom_factor=1 - zoom,
+                            shear_factor=shear / 100.0)
+    return apply_affine(img, M)
+
+
+def augment_file(task, stats=NULL_STATS):
+    """Read a single image once and write its augmented variants. Returns (image_file, ok).
+
+    Time spent reading, augmenting and writing is added to stats.
+    """
+    folder_path, output_path, image_file, params, seed, variants, encoding = task
+
+    img = read_image(os.path.join(folder_path, image_file), stats)
+    if img is None:
+        return image_file, False
+    # Save the augmented images
+    outputs = [write_output(output_path, image_file, variant, augmented_img, stats, encoding)
+               for variant, augmented_img in augment_variants(task, img, stats)]
+    stats.count("images")
+    return image_file, _written(outputs)
+
+
+def augment_variants(task, img, stats=NULL_STATS):
+    """Yield (variant, augmented image) for every variant of the decoded image of task."""
+    _, _, image_file, params, seed, variants, _ = task
+    for variant in variant_numbers(variants):
+        rng = np.random.default_rng(image_seed(seed, image_file, variant))
+        with stats.timer("augment"):
+            augmented_img = apply_augmentation(img, *params, rng)
+        yield variant, augmented_img
+
+
+def _pipelined_tasks(tasks, io_threads, token=None, stats=NULL_STATS, depth=None):
+    """Run augment_file over tasks in this thread, with reads and writes overlapped on other threads.
+
+    A pool of io_threads threads reads and decodes up to depth images ahead, two per thread
+    by default, while this thread augments, and a second pool encodes and writes the results
+    behind it. cv2 releases the GIL while decoding, encoding and warping, so storage latency
+    is hidden behind the augmentation. Results are yielded in order once all their writes
+    have finished. token is checked before each image is augmented; on cancel the prefetched
+    images are dropped and the writes already queued are finished first.
+    """
+    depth = depth or 2 * io_threads
+    tasks = iter(tasks)
+    reads = collections.deque()  # (task, future image), in task order
+    writes = collections.deque()  # (image_file, [future ok] or None if it could not be read)
+
+    def prefetch():
+        while len(reads) < depth:
+            task = next(tasks, None)
+            if task is None:
+                return
+            folder_path, _, image_file = task[:3]
+            reads.append((task, readers.submit(read_image, os.path.join(folder_path, image_file), stats)))
+
+    def written(item):
+        image_file, futures = item
+        if futures is None:
+            return image_file, False
+        with stats.timer("write_wait"):
+            return image_file, _written([future.result() for future in futures])
+
+    with concurrent.futures.ThreadPoolExecutor(io_threads, thread_name_prefix="prefetch") as readers, \
+            concurrent.futures.ThreadPoolExecutor(io_threads, thread_name_prefix="write-behind") as writers:
+        try:
+            prefetch()
+            while reads:
+                check(token)
+                task, future = reads.popleft()
+                prefetch()
+                stats.sample_queue("prefetched", len(reads))
+                # Time this thread spends waiting here is read latency the prefetch did not hide
+                with stats.timer("read_wait"):
+                    img = future.result()
+                if img is None:
+                    writes.append((task[2], None))
+                else:
+                    output_path, image_file, encoding = task[1], task[2], task[6]
+                    writes.append((image_file, [writers.submit(write_output, output_path, image_file, variant,
+                                                               augmented_img, stats, encoding)
+                                                for variant, augmented_img in augment_variants(task, img, stats)]))
+                    stats.count("images")
+                stats.sample_queue("write_behind", len(writes))
+
+                # Hand back finished images, and wait for the oldest when too many writes are queued
+                while writes and (len(writes) > depth or all(future.done() for future in writes[0][1] or ())):
+                    yield written(writes.popleft())
+            while writes:
+                yield written(writes.popleft())
+        finally:
+            for _, future in reads:
+                future.cancel()
+
+
+def _init_pool_worker():
+    # One OpenCV thread per process, otherwise N processes each spawn N threads
+    cv2.setNumThreads(1)
+
+
+def _run_chunk(function, tasks, instrument=False):
+    # Child processes measure into their own RunStats and send a snapshot back with the results
+    stats = RunStats("chunk") if instrument else NULL_STATS
+    results = [function(task, stats) for task in tasks]
+    return results, stats.snapshot() if instrument else None
+
+
+def _map_tasks(function, tasks, workers, chunksize, token=None, max_in_flight=None, stats=NULL_STATS):
+    """Run function over tasks in this process, or over a pool of workers in completion order.
+
+    token is checked before each task (or chunk of chunksize tasks) starts. At most
+    max_in_flight chunks, two per worker by default, are queued or running at a time, which
+    bounds the images held in memory and the work left to finish after a pause or cancel.
+    function is called as function(task, stats); measurements made in the pool are merged into stats.
+    """
+    if workers <= 1:
+        for task in tasks:
+            check(token)
+            yield function(task, stats)
+        return
+
+    tasks = iter(tasks)
+    chunks = iter(lambda: list(itertools.islice(tasks, chunksize)), [])
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=spawn_context(),
+                                                      initializer=_init_pool_worker)
+    running = set()
+    try:
+        for chunk in chunks:
+            check(token)
+            running.add(executor.submit(_run_chunk, function, chunk, stats.enabled))
+            stats.sample_queue("chunks_in_flight", len(running))
+            if len(running) >= (max_in_flight or 2 * workers):
+                done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                yield from _chunk_results(done, stats)
+        while running:
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            yield from _chunk_results(done, stats)
+    finally:
+        # Chunks already running finish their writes, queued ones never start
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _chunk_results(futures, stats):
+    for future in futures:
+        results, snapshot = future.result()
+        stats.merge(snapshot)
+        yield from results
+
+
+def _write_shards(results, writer, stats=NULL_STATS):
+    """Add the packed outputs of results to writer, yielding (image_file, ok). Closes writer when done.
+
+    An image's sub-folder is its label, so a tree of class folders keeps its classes.
+    """
+    try:
+        for image_file, packed in results:
+            if packed:
+                label = os.path.dirname(image_file) or None
+                try:
+                    with stats.timer("shard_write"):
+                        written = sum(writer.add(name, payload, label) for name, payload in packed)
+                except (ValueError, cv2.error):  # An image that does not fit an .npy shard
+                    packed = False
+                else:
+                    stats.count("bytes_written", written)
+            yield image_file, bool(packed)
+    finally:
+        writer.close()
+
+
+def list_images(folder_path, output_path=None, extensions=IMAGE_EXTENSIONS, recursive=False, cache=False):
+    """Lazily yield the images under folder_path, relative to it, skipping the output folder when nested."""
+    return scan_files(folder_path, extensions, recursive, cache, exclude=(output_path,) if output_path else ())
+
+
+def _skip_finished(folder_path, image_files, manifest, source_stats, finished):
+    """Yield the images manifest has no up-to-date outputs for, queueing the others on finished."""
+    for image_file in image_files:
+        stat = os.stat(os.path.join(folder_path, image_file))
+        if manifest.is_complete(os.path.join(folder_path, image_file), stat):
+            finished.append(image_file)
+        else:
+            source_stats[image_file] = stat  # Taken before the image is read, see JobManifest.record
+            yield image_file
+
+
+def augment_folder(folder_path, output_path, params, workers=1, seed=None, chunksize=8, variants=1,
+                   extensions=IMAGE_EXTENSIONS, recursive=False, cache=False, resume=False,
+                   token=None, max_in_flight=None, stats=None, io_threads=0, encoding=None, shards=None,
+                   image_files=None):
+    """Augment every image in folder_path, yielding (image_file, ok) in completion order.
+
+    ok is None for an image a resumed run finds already done; the README describes the options.
+    image_files, paths relative to folder_path, replaces the folder scan when given.
+    """
+    if shards is not None and resume:
+        raise ValueError("Resuming is not supported with shard output")
+    stats = stats or NULL_STATS
+    if image_files is None:
+        image_files = list_images(folder_path, output_path, extensions, recursive, cache)
+    if os.path.abspath(folder_path) == os.path.abspath(output_path):
+        image_files = list(image_files)  # Snapshot first so the outputs are not picked up as inputs
+
+    manifest = None
+    if resume:
+        job = {"params": params, "seed": seed, "variants": variants,
+               "encoding": (encoding or DEFAULT_ENCODING).settings()}
+        manifest = JobManifest(output_path, job)
+        source_stats, finished = {}, collections.deque()
+        image_files = _skip_finished(folder_path, image_files, manifest, source_stats, finished)
+
+    output = output_path if shards is None else shards  # Where write_output puts the augmented images
+    tasks = ((folder_path, output, image_file, params, seed, variants, encoding) for image_file in image_files)
+    if workers <= 1 and io_threads > 0:
+        results = _pipelined_tasks(tasks, io_threads, token, stats)
+    else:
+        results = _map_tasks(augment_file, tasks, workers, chunksize, token, max_in_flight, stats)
+
+    if shards is not None:
+        yield from _write_shards(results, ShardWriter(output_path, shards, "aug"), stats)
+        return
+    if manifest is None:
+        yield from results
+        return
+
+    try:
+        for image_file, ok in results:
+            while finished:
+                yield finished.popleft(), None
+            stat = source_stats.pop(image_file)
+            if ok:
+                outputs = [output_name(image_file, variant, encoding) for variant in variant_numbers(variants)]
+                manifest.record(os.path.join(folder_path, image_file), stat, outputs)
+            yield image_file, ok
+        while finished:
+            yield finished.popleft(), None
+    finally:
+        manifest.close()
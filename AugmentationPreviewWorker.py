@@ -0,0 +1,65 @@
+import threading
+import cv2
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QImage
+from AugmentationCore import preview_augmentation
+from PreviewImage import shrink_to_fit, to_qimage
+
+class AugmentationPreviewWorker(QThread):
+    preview_ready = Signal(QImage)  # Signal to emit the rendered preview
+
+    def __init__(self, preview_size):
+        super().__init__()
+        self.preview_width, self.preview_height = preview_size
+        self.proxy = None  # Source image downscaled to the preview size
+        self.condition = threading.Condition()
+        # Only the latest image and parameters are ever served, older requests are dropped
+        self.pending_path = None
+        self.pending_params = None
+        self.last_params = None
+        self.stopping = False
+
+    def load_image(self, image_path):
+        """Read image_path and use it for subsequent previews."""
+        with self.condition:
+            self.pending_path = image_path
+            self.condition.notify()
+
+    def request_preview(self, params):
+        """Render (rotation, flip_lr, flip_tb, zoom, shear). Replaces any request that has not started yet."""
+        with self.condition:
+            self.pending_params = params
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending_path is None and self.pending_params is None and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    break
+                image_path, self.pending_path = self.pending_path, None
+                params, self.pending_params = self.pending_params, None
+
+            if image_path is not None:
+                self.proxy = self.load_proxy(image_path)
+            if params is not None:
+                self.last_params = params
+            if self.proxy is None or self.last_params is None:
+                continue
+
+            augmented_img = preview_augmentation(self.proxy, *self.last_params)
+            self.preview_ready.emit(to_qimage(augmented_img))
+
+    def load_proxy(self, image_path):
+        """Read an image and shrink it to fit the preview, so rendering cost no longer depends on its size."""
+        img = cv2.imread(image_path)
+        if img is None:
+            return None
+        return shrink_to_fit(img, self.preview_width, self.preview_height)
@@ -1,86 +1,125 @@
 import os
-import cv2
-from numpy import random
-import numpy as np
+import queue
+import threading
 from PySide6.QtCore import QThread, Signal
+from AugmentationCore import apply_augmentation, augment_folder, list_images
+from JobControl import Cancelled, JobToken
+from Instrumentation import PROFILE_ENV, profiled, stats_from_env
 
 class AugmentationWorker(QThread):
     log_signal = Signal(str)  # Signal to emit log messages
     finished_signal = Signal()  # Signal to emit when the process is finished
-    progress_signal = Signal(int)  # Signal to emit progress updates
+    progress_signal = Signal(int, int)  # Signal to emit (images done, images total), total 0 while scanning
 
-    def __init__(self, folder_path, output_path, params, total_images):
+    def __init__(self, folder_path, output_path, params, workers=1, seed=None, variants=1,
+                 recursive=False, cache=False, resume=False, io_threads=0, encoding=None,
+                 shards=None):
         super().__init__()
         self.folder_path = folder_path
         self.output_path = output_path
         self.params = params
-        self.total_images = total_images
+        self.total_images = 0  # Images found so far by the scan thread
+        self.scan_done = False  # Set once the scan has found every image and total_images is final
+        self.workers = workers  # Number of worker processes, 1 runs everything in this thread
+        self.seed = seed  # Base seed for reproducible runs, None for fresh randomness
+        self.variants = variants  # Augmented outputs per source image, all from a single decode
+        self.recursive = recursive  # Also augment images in sub-folders
+        self.cache = cache  # Reuse the on-disk file index of earlier scans
+        self.resume = resume  # Skip images whose outputs a previous run already completed
+        self.io_threads = io_threads  # Threads reading ahead and writing behind, 0 reads and writes inline
+        self.encoding = encoding  # ImageEncoding of the outputs, None keeps each source's format
+        self.shards = shards  # ShardFormat to pack the outputs into, None writes one file per image
+        self.token = JobToken()  # Pauses or cancels the run between images
+        self.stats = stats_from_env("augment")
 
     def run(self):
-        rotation, flip_lr, flip_tb, zoom, shear, probability = self.params
-
         # Counter for processed images
         processed_images = 0
+        resumed_images = 0  # Already augmented by an earlier run
+        batch = []
+        cancelled = False
 
-        # Iterate over the images in the selected folder
-        for image_file in os.listdir(self.folder_path):
-            if image_file.endswith(".jpg") or image_file.endswith(".png"):
-                img = cv2.imread(os.path.join(self.folder_path, image_file))
-                augmented_img = self.apply_augmentation(img, rotation, flip_lr, flip_tb, zoom, shear,probability)
-
-                # Save the augmented image
-                output_file = os.path.join(self.output_path, f"aug_{image_file}")
-                cv2.imwrite(output_file, augmented_img)
+        # The folder is walked once, on its own thread so the total is known long before the run ends
+        self.progress_signal.emit(0, 0)
+        found = queue.Queue()
+        stop_scan = threading.Event()
+        threading.Thread(target=self.scan_images, args=(found, stop_scan), daemon=True).start()
 
-                # Increment the processed images count
-                processed_images += 1
+        try:
+            with profiled(os.environ.get(PROFILE_ENV)):
+                for image_file, ok in augment_folder(self.folder_path, self.output_path, self.params,
+                                                     workers=self.workers, seed=self.seed,
+                                                     variants=self.variants, image_files=self.found_images(found),
+                                                     resume=self.resume, token=self.token, stats=self.stats,
+                                                     io_threads=self.io_threads, encoding=self.encoding,
+                                                     shards=self.shards):
+                    if ok is None:
+                        resumed_images += 1
+                    elif not ok:
+                        self.log_signal.emit(f"Skipped {image_file} (could not be read or written)")
+                    processed_images += 1
+                    batch.append(image_file)
 
-                # Emit log message for each processed image
-                self.log_signal.emit(f"Processed {image_file}")
+                    # Emit signals roughly 100 times per run rather than once per image
+                    if len(batch) >= max(1, self.total_images // 100):
+                        self.emit_batch(batch, processed_images)
+                        batch = []
+        except Cancelled:
+            cancelled = True
+        except Exception as e:
+            self.log_signal.emit(f"Augmentation failed: {e}")
+        finally:
+            stop_scan.set()
 
-                # Emit progress signal (processed_images / total_images * 100)
-                self.progress_signal.emit(processed_images)
+        if batch:
+            self.emit_batch(batch, processed_images)
+        else:
+            self.progress_signal.emit(processed_images, max(1, self.total_images))
+        if cancelled:
+            self.log_signal.emit("Augmentation cancelled.")
+        if resumed_images:
+            self.log_signal.emit(f"{resumed_images} images were already augmented and were skipped.")
 
         # Emit finished signal when done
         self.finished_signal.emit()
 
-    def apply_augmentation(self, img, rotation, flip_lr, flip_tb, zoom, shear, probability):
-        """Apply OpenCV-based augmentations."""
-        height, width = img.shape[:2]
-    
-        choice = random.choice([0,rotation],p =[1-probability,probability]) #randomness from user parameter 
-        if choice:
-        # 1. Rotation
-            M_rotate = cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1)
-            img = cv2.warpAffine(img, M_rotate, (width, height))
+    def scan_images(self, found, stop_scan):
+        """Walk the input folder, counting the images in total_images and queueing them on found.
 
-         # 2. Horizontal flip
-        if flip_lr == "Yes":
-                choice = random.choice([0,1],p =[1-probability,probability])
-                if choice:
-                    img = cv2.flip(img, 1)
-        # 3. Vertical flip
-        if flip_tb == "Yes":
-                choice = random.choice([0,1],p =[1-probability,probability])
-                if choice:
-                    img = cv2.flip(img, 0)
+        Ends the queue with None, or with the exception that stopped the scan.
+        """
+        try:
+            for image_file in list_images(self.folder_path, self.output_path, recursive=self.recursive,
+                                          cache=self.cache):
+                if stop_scan.is_set():
+                    return
+                self.total_images += 1
+                found.put(image_file)
+            self.scan_done = True
+            found.put(None)
+        except Exception as e:
+            found.put(e)
 
-       
-        
-        # 4. Zoom (crop and resize)
-        zoom_factor = 1 - zoom  # Zoom factor (less than 1 for zooming in)
-        choice = random.choice([0,zoom_factor],p =[1-probability,probability])
-        if choice:
-            new_height, new_width = int(height * zoom_factor), int(width * zoom_factor)
-            crop_img = img[int((height - new_height) / 2):int((height + new_height) / 2),
-                        int((width - new_width) / 2):int((width + new_width) / 2)]
-            img = cv2.resize(crop_img, (width, height))
-        
-        # 5. Shear (apply horizontal shear)
-        shear_factor = shear / 100.0
-        choice = random.choice([0,zoom_factor],p =[1-probability,probability])
-        if choice:
-            M_shear = np.array([[1, shear_factor, 0], [0, 1, 0]], dtype=np.float32)
-            img = cv2.warpAffine(img, M_shear, (width, height))
+    @staticmethod
+    def found_images(found):
+        """Yield the images scan_images queues, re-raising its error here."""
+        while True:
+            item = found.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
 
-        return img
+    def emit_batch(self, batch, processed_images):
+        """Emit one log message and one progress update for a batch of processed images."""
+        total = f"{self.total_images}" if self.scan_done else f"{self.total_images} found so far"
+        if len(batch) == 1:
+            self.log_signal.emit(f"Processed {batch[0]}")
+        else:
+            self.log_signal.emit(f"Processed {len(batch)} images ({processed_images}/{total})")
+        self.progress_signal.emit(processed_images, max(1, self.total_images) if self.scan_done else 0)
+
+    def apply_augmentation(self, img, rotation, flip_lr, flip_tb, zoom, shear, probability):
+        """Apply OpenCV-based augmentations."""
+        return apply_augmentation(img, rotation, flip_lr, flip_tb, zoom, shear, probability)
@@ -1,16 +1,20 @@
 import os
-import cv2
-import numpy as np
 from PySide6 import QtWidgets, QtCore, QtGui
 from pathlib import Path
 from AugmentationWorker import AugmentationWorker
+from AugmentationCore import list_images, preview_augmentation
+from AugmentationPreviewWorker import AugmentationPreviewWorker
+from JobControlWidget import JobControlWidget
+from Instrumentation import finish_stats
+from LogSink import LogSink
+from EncodingOptionsWidget import EncodingOptionsWidget
 
 class DataAugmentorWidget(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.output_folder_clicked = False
         self.folder_clicked = False
-        self.current_image = None  # To store the currently loaded image
+        self.current_image_path = None  # To store the path of the image used for the live preview
 
         main_layout = QtWidgets.QHBoxLayout()  # Change to horizontal layout for side-by-side view
         self.setLayout(main_layout)
@@ -137,6 +141,67 @@ class DataAugmentorWidget(QtWidgets.QWidget):
             form_layout.addRow(warning_label)
             self.warning_labels.append(warning_label)
 
+        # Parallel execution settings
+        workers_label = QtWidgets.QLabel("Worker Processes:")
+        workers_label.setStyleSheet("font-size: 14px;")
+        self.workers_input = QtWidgets.QSpinBox(self)
+        self.workers_input.setFixedWidth(50)
+        self.workers_input.setRange(1, os.cpu_count() or 1)
+        self.workers_input.setValue(1)  # Default to a single worker
+        form_layout.addRow(workers_label, self.workers_input)
+
+        io_threads_label = QtWidgets.QLabel("I/O Threads:")
+        io_threads_label.setStyleSheet("font-size: 14px;")
+        self.io_threads_input = QtWidgets.QSpinBox(self)
+        self.io_threads_input.setFixedWidth(50)
+        self.io_threads_input.setRange(0, 32)
+        self.io_threads_input.setValue(4)  # Read ahead and write behind by default
+        form_layout.addRow(io_threads_label, self.io_threads_input)
+        io_threads_desc_label = QtWidgets.QLabel("Read and write images in the background with a single worker, "
+                                                 "0 to turn off. Helps most on network storage")
+        io_threads_desc_label.setStyleSheet("font-size: 12px; color: grey;")
+        io_threads_desc_label.setWordWrap(True)
+        form_layout.addRow(io_threads_desc_label)
+
+        variants_label = QtWidgets.QLabel("Variants Per Image:")
+        variants_label.setStyleSheet("font-size: 14px;")
+        self.variants_input = QtWidgets.QSpinBox(self)
+        self.variants_input.setFixedWidth(70)
+        self.variants_input.setRange(1, 100)
+        self.variants_input.setValue(1)  # Default to one augmented copy per image
+        form_layout.addRow(variants_label, self.variants_input)
+
+        self.encoding_options = EncodingOptionsWidget(parent=self)
+        form_layout.addRow(self.encoding_options)
+
+        seed_label = QtWidgets.QLabel("Random Seed:")
+        seed_label.setStyleSheet("font-size: 14px;")
+        self.seed_input = QtWidgets.QLineEdit(self)
+        self.seed_input.setFixedWidth(100)
+        self.seed_input.setPlaceholderText("random")
+        self.seed_input.setValidator(QtGui.QIntValidator(0, 2**31 - 1))
+        form_layout.addRow(seed_label, self.seed_input)
+        seed_desc_label = QtWidgets.QLabel("Set a seed to make augmentation results reproducible")
+        seed_desc_label.setStyleSheet("font-size: 12px; color: grey;")
+        form_layout.addRow(seed_desc_label)
+
+        self.recursive_checkbox = QtWidgets.QCheckBox("Include images in subfolders", self)
+        self.recursive_checkbox.setStyleSheet("font-size: 14px;")
+        form_layout.addRow(self.recursive_checkbox)
+
+        self.index_cache_checkbox = QtWidgets.QCheckBox("Reuse file index between runs", self)
+        self.index_cache_checkbox.setStyleSheet("font-size: 14px;")
+        self.index_cache_checkbox.setToolTip("Keep the folder listing in ~/.cache/cvhelper, so scanning a large, "
+                                             "unchanged folder again is nearly free")
+        form_layout.addRow(self.index_cache_checkbox)
+
+        self.resume_checkbox = QtWidgets.QCheckBox("Skip images already augmented with these settings", self)
+        self.resume_checkbox.setStyleSheet("font-size: 14px;")
+        form_layout.addRow(self.resume_checkbox)
+        # Shard output has no per-image manifest to resume from
+        self.encoding_options.shards_input.currentIndexChanged.connect(
+            lambda: self.resume_checkbox.setEnabled(self.encoding_options.shards() is None))
+
         # Folder Path
         folder_layout = QtWidgets.QHBoxLayout()
         param_layout.addLayout(folder_layout)
@@ -190,6 +255,10 @@ class DataAugmentorWidget(QtWidgets.QWidget):
         self.augment_button.clicked.connect(self.process_augmentation_pipeline)
         param_layout.addWidget(self.augment_button)
 
+        # Pause / Cancel for the running augmentation
+        self.job_controls = JobControlWidget(self)
+        param_layout.addWidget(self.job_controls)
+
         # Progress bar
         self.progress_bar = QtWidgets.QProgressBar(self)
         self.progress_bar.setValue(0)
@@ -210,6 +279,16 @@ class DataAugmentorWidget(QtWidgets.QWidget):
         self.log_output = QtWidgets.QTextEdit()
         self.log_output.setReadOnly(True)
         right_layout.addWidget(self.log_output)
+        self.log_sink = LogSink(self.log_output, self.update_progress_bar, parent=self)
+
+        # Live preview rendering runs on a background thread against a label-sized proxy
+        self.preview_worker = AugmentationPreviewWorker((self.image_label.width(), self.image_label.height()))
+        self.preview_worker.preview_ready.connect(self.display_live_sample)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.preview_worker.stop)
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(30)  # Milliseconds of slider quiet before rendering
+        self.preview_timer.timeout.connect(self.render_live_sample)
 
     def sync_slider_with_line_edit(self, index):
         
@@ -265,19 +344,25 @@ class DataAugmentorWidget(QtWidgets.QWidget):
             self.augment_button.setEnabled(True)
     def load_first_image(self, folder_path):
         """Load the first image from the folder to use for live preview."""
-        for file_name in os.listdir(folder_path):
-            if file_name.endswith(".jpg") or file_name.endswith(".png"):
-                img_path = os.path.join(folder_path, file_name)
-                self.current_image = cv2.imread(img_path)  # Read image using OpenCV
-                self.update_live_sample()  # Display the image
-                break
+        # The scan is lazy, so this stops at the first image instead of listing the whole folder
+        for file_name in list_images(folder_path, recursive=self.recursive_checkbox.isChecked()):
+            self.current_image_path = os.path.join(folder_path, file_name)
+            # The worker reads the image and keeps a label-sized proxy of it
+            self.preview_worker.load_image(self.current_image_path)
+            if not self.preview_worker.isRunning():
+                self.preview_worker.start()
+            self.update_live_sample()  # Display the image
+            break
 
     def update_live_sample(self):
         """Update the live sample image preview based on the current augmentation parameters."""
-        if self.current_image is None:
-            return
+        # Restart the debounce timer so a burst of slider events renders once
+        self.preview_timer.start()
 
-        valid = True  # Track whether all inputs are valid
+    def render_live_sample(self):
+        """Send the current augmentation parameters to the preview worker."""
+        if self.current_image_path is None:
+            return
 
         # Get augmentation parameters from inputs, with default values if the inputs are empty
         try:
@@ -286,61 +371,26 @@ class DataAugmentorWidget(QtWidgets.QWidget):
             flip_tb = self.param_inputs[2].currentText()
             zoom = float(self.param_inputs[3].text()) if self.param_inputs[3].text() else 0.0
             shear = int(self.param_inputs[4].text()) if self.param_inputs[4].text() else 0
-            
+
         except ValueError as e:
             self.append_log(f"Invalid input: {e}")
             return
 
-        # Apply augmentations
-        augmented_img = self.apply_augmentation(self.current_image.copy(), rotation, flip_lr, flip_tb, zoom, shear)
-        # Convert the augmented image from BGR to RGB before displaying
-        augmented_img_rgb = cv2.cvtColor(augmented_img, cv2.COLOR_BGR2RGB)
-        # Convert the augmented image to QPixmap and display it in the QLabel
-        height, width, channel = augmented_img_rgb.shape
-        bytes_per_line = 3 * width
-        q_img = QtGui.QImage(augmented_img_rgb.data, width, height, bytes_per_line, QtGui.QImage.Format_RGB888)
+        # Apply augmentations off the GUI thread, on the downscaled proxy
+        self.preview_worker.request_preview((rotation, flip_lr, flip_tb, zoom, shear))
+
+    def display_live_sample(self, q_img):
         pixmap = QtGui.QPixmap.fromImage(q_img)
         pixmap = pixmap.scaled(self.image_label.size(), QtCore.Qt.KeepAspectRatio)
         self.image_label.setPixmap(pixmap)
 
     def apply_augmentation(self, img, rotation, flip_lr, flip_tb, zoom, shear):
         """Apply OpenCV-based augmentations."""
-        height, width = img.shape[:2]
-
-        # 1. Rotation
-        M_rotate = cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1)
-        img = cv2.warpAffine(img, M_rotate, (width, height))
-
-        # 2. Horizontal flip
-        if flip_lr == "Yes":
-            img = cv2.flip(img, 1)
-
-        # 3. Vertical flip
-        if flip_tb == "Yes":
-            img = cv2.flip(img, 0)
-
-        # 4. Zoom (crop and resize)
-        zoom_factor = 1 - zoom  # Zoom factor (less than 1 for zooming in)
-        new_height, new_width = int(height * zoom_factor), int(width * zoom_factor)
-        crop_img = img[int((height - new_height) / 2):int((height + new_height) / 2),
-                       int((width - new_width) / 2):int((width + new_width) / 2)]
-        img = cv2.resize(crop_img, (width, height))
-
-        # 5. Shear (apply horizontal shear)
-        shear_factor = shear / 100.0
-        M_shear = np.array([[1, shear_factor, 0], [0, 1, 0]], dtype=np.float32)
-        img = cv2.warpAffine(img, M_shear, (width, height))
-
-        return img
+        return preview_augmentation(img, rotation, flip_lr, flip_tb, zoom, shear)
 
     def process_augmentation_pipeline(self):
-        self.log_output.clear()
+        self.log_sink.clear()
         self.progress_bar.setValue(0)
-        folder_path = self.foldername.text()
-
-        # Get the total number of images in the folder
-        total_images = len([f for f in os.listdir(folder_path) if f.endswith((".jpg", ".png"))])
-        self.progress_bar.setMaximum(total_images)
         """Start augmentation in a separate thread."""
         # Get current parameter values
         rotation, flip_lr, flip_tb, zoom, shear, probability = self.get_augmentation_parameters()
@@ -354,18 +404,41 @@ class DataAugmentorWidget(QtWidgets.QWidget):
             self.append_log("No augment parameters selected. Please tweak the parameters and try again.")
             return
        # Create and start the worker thread
+        seed = int(self.seed_input.text()) if self.seed_input.text() else None
         self.worker = AugmentationWorker(self.foldername.text(), self.output_foldername.text(),
-                                         (rotation, flip_lr, flip_tb, zoom, shear, probability), total_images)
+                                         (rotation, flip_lr, flip_tb, zoom, shear, probability),
+                                         workers=self.workers_input.value(), seed=seed,
+                                         variants=self.variants_input.value(),
+                                         recursive=self.recursive_checkbox.isChecked(),
+                                         cache=self.index_cache_checkbox.isChecked(),
+                                         resume=self.resume_checkbox.isEnabled() and self.resume_checkbox.isChecked(),
+                                         io_threads=self.io_threads_input.value(),
+                                         encoding=self.encoding_options.encoding(),
+                                         shards=self.encoding_options.shards())
 
         # Connect signals to update the log and handle completion
-        self.worker.log_signal.connect(self.append_log)
-        self.worker.progress_signal.connect(self.update_progress_bar)
-        self.worker.finished_signal.connect(lambda: self.append_log("Augmentation completed for all images."))
+        self.worker.log_signal.connect(self.log_sink.append)
+        self.worker.progress_signal.connect(self.log_sink.progress)
+        self.worker.finished_signal.connect(self.augmentation_finished)
 
         # Start the worker thread
+        self.log_sink.start("augment", self.worker.stats)
+        self.augment_button.setEnabled(False)
+        self.job_controls.set_token(self.worker.token)
         self.worker.start()
-    def update_progress_bar(self, value):
-        """Update the progress bar with the given value."""
+
+    def augmentation_finished(self):
+        if not self.worker.token.cancelled:
+            self.append_log("Augmentation completed for all images.")
+        self.log_sink.flush()  # Counted in the stats summary
+        finish_stats(self.worker.stats, self.append_log)
+        self.log_sink.finish()
+        self.job_controls.set_token(None)
+        self.check_if_ready()
+
+    def update_progress_bar(self, value, maximum):
+        """Update the progress bar; a maximum of 0 shows it as busy while the worker scans the folder."""
+        self.progress_bar.setMaximum(maximum)
         self.progress_bar.setValue(value)
 
     def get_augmentation_parameters(self):
@@ -379,6 +452,5 @@ class DataAugmentorWidget(QtWidgets.QWidget):
         return rotation, flip_lr, flip_tb, zoom, shear, probability
 
     def append_log(self, message):
-        """Append log message to the QTextEdit."""
-        self.log_output.append(message)
-        self.log_output.verticalScrollBar().setValue(self.log_output.verticalScrollBar().maximum())
+        """Append log message to the QTextEdit, at the next LogSink update."""
+        self.log_sink.append(message)
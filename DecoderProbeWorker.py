@@ -0,0 +1,25 @@
+from PySide6.QtCore import QThread, Signal
+from VideoDecoding import probe_decoders
+
+class DecoderProbeWorker(QThread):
+    log_signal = Signal(str)  # Signal to emit log messages
+    result_signal = Signal(object)  # Signal to emit the fastest VideoDecoding, or None if no configuration worked
+    finished_signal = Signal()  # Signal to emit when the probe is finished
+
+    def __init__(self, video_path, frames=100):
+        super().__init__()
+        self.video_path = video_path
+        self.frames = frames  # Frames decoded per configuration
+
+    def run(self):
+        self.log_signal.emit(f"Timing decoder settings on {self.video_path}...")
+        try:
+            results = probe_decoders(self.video_path, self.frames)
+        except Exception as e:
+            self.log_signal.emit(f"Decoder probe failed: {e}")
+            results = []
+        for result in results:
+            self.log_signal.emit(f"  {result['decoding'].describe()}: {result['fps']:.1f} frames/s "
+                                 f"({result['backend']}, {result['hw_acceleration']})")
+        self.result_signal.emit(results[0]["decoding"] if results else None)
+        self.finished_signal.emit()
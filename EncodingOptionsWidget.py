@@ -0,0 +1,96 @@
+from PySide6 import QtWidgets
+from ImageEncoding import ImageEncoding
+from ShardWriter import ShardFormat
+
+FORMAT_LABELS = {
+    "jpg": "JPEG",
+    "png": "PNG",
+    "webp": "WebP",
+    "bmp": "BMP (uncompressed)",
+    "npy": "NumPy .npy (raw, fastest)",
+}
+
+SHARD_LABELS = {
+    None: "One file per image",
+    "tar": "Tar shards",
+    "npy": "NumPy shards (fixed size)",
+}
+
+
+class EncodingOptionsWidget(QtWidgets.QWidget):
+    """Output format, quality and PNG compression level, read back as an ImageEncoding, and
+    whether the outputs are packed into shards, read back as a ShardFormat.
+
+    The first format is "same"; default_label names it (e.g. "Same as source") and a
+    format with the same label is left out.
+    """
+
+    def __init__(self, default_label="Same as source", label_style="font-size: 14px;", parent=None):
+        super().__init__(parent)
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        format_label = QtWidgets.QLabel("Output format:")
+        format_label.setStyleSheet(label_style)
+        self.format_input = QtWidgets.QComboBox(self)
+        self.format_input.addItem(default_label, "same")
+        for output_format, label in FORMAT_LABELS.items():
+            if label != default_label:
+                self.format_input.addItem(label, output_format)
+        self.format_input.currentIndexChanged.connect(self.update_inputs)
+
+        quality_label = QtWidgets.QLabel("Quality:")
+        quality_label.setStyleSheet(label_style)
+        self.quality_input = QtWidgets.QSpinBox(self)
+        self.quality_input.setRange(0, 101)
+        self.quality_input.setSpecialValueText("Default")  # 0 leaves OpenCV's default (JPEG 95)
+        self.quality_input.setToolTip("JPEG and WebP quality, 101 makes WebP lossless")
+
+        png_label = QtWidgets.QLabel("PNG level:")
+        png_label.setStyleSheet(label_style)
+        self.png_compression_input = QtWidgets.QSpinBox(self)
+        self.png_compression_input.setRange(-1, 9)
+        self.png_compression_input.setValue(-1)
+        self.png_compression_input.setSpecialValueText("Default")  # -1 leaves OpenCV's default
+        self.png_compression_input.setToolTip("PNG compression 0-9, lower is faster and larger")
+
+        shards_label = QtWidgets.QLabel("Write:")
+        shards_label.setStyleSheet(label_style)
+        self.shards_input = QtWidgets.QComboBox(self)
+        for shard_format, label in SHARD_LABELS.items():
+            self.shards_input.addItem(label, shard_format)
+        self.shards_input.setToolTip("Pack the outputs into large shards with an index instead of one file each; "
+                                     "NumPy shards hold raw pixels, resized to the size of the first image")
+        self.shards_input.currentIndexChanged.connect(self.update_inputs)
+
+        layout.addWidget(format_label)
+        layout.addWidget(self.format_input)
+        layout.addWidget(quality_label)
+        layout.addWidget(self.quality_input)
+        layout.addWidget(png_label)
+        layout.addWidget(self.png_compression_input)
+        layout.addWidget(shards_label)
+        layout.addWidget(self.shards_input)
+        self.update_inputs()
+
+    def update_inputs(self):
+        """Only enable the settings the chosen format uses; "same" may be any format."""
+        output_format = self.format_input.currentData()
+        raw = self.shards_input.currentData() == "npy"  # NumPy shards store pixels, nothing is encoded
+        self.format_input.setEnabled(not raw)
+        self.quality_input.setEnabled(not raw and output_format in ("same", "jpg", "webp"))
+        self.png_compression_input.setEnabled(not raw and output_format in ("same", "png"))
+
+    def encoding(self):
+        """The chosen ImageEncoding, or None when everything is left at its default."""
+        output_format = self.format_input.currentData()
+        quality = self.quality_input.value() or None
+        png_compression = self.png_compression_input.value() if self.png_compression_input.value() >= 0 else None
+        if output_format == "same" and quality is None and png_compression is None:
+            return None
+        return ImageEncoding(output_format, quality, png_compression)
+
+    def shards(self):
+        """The chosen ShardFormat, or None to write one file per image."""
+        shard_format = self.shards_input.currentData()
+        return ShardFormat(shard_format) if shard_format else None
@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+INDEX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cvhelper")
+
+
+def normalize_extensions(extensions):
+    """Return extensions lower-cased with a leading dot, as a tuple for str.endswith."""
+    if isinstance(extensions, str):
+        extensions = extensions.split(",")
+    return tuple(("" if ext.startswith(".") else ".") + ext.lower() for ext in (ext.strip() for ext in extensions) if ext)
+
+
+def index_cache_path(folder_path):
+    """Location of the cached index for folder_path.
+
+    It lives outside the folder, writing it inside would change the folder's mtime and invalidate it.
+    """
+    key = hashlib.sha1(os.path.abspath(folder_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(INDEX_CACHE_DIR, f"index-{key}.json")
+
+
+def load_index(cache_path):
+    try:
+        with open(cache_path) as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}  # No usable index yet, everything gets scanned
+
+
+def save_index(cache_path, index):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(temp_path, cache_path)  # Never leave a half-written index behind
+
+
+def _join(relative, name):
+    # Relative paths always use "/" so names (and the seeds derived from them) match across platforms
+    return f"{relative}/{name}" if relative else name
+
+
+def scan_files(folder_path, extensions=IMAGE_EXTENSIONS, recursive=False, cache=False, exclude=()):
+    """Yield the paths, relative to folder_path, of the files whose extension is in extensions (any case).
+
+    Files are yielded while each directory is being read, so work can start before the scan
+    finishes. With recursive set, sub-folders are walked as well, except those listed in exclude.
+    With cache set, every directory listing is kept in an on-disk index and reused for as long
+    as the directory's mtime is unchanged, so rescanning a large tree costs one stat per directory.
+    """
+    extensions = normalize_extensions(extensions)
+    excluded = {os.path.abspath(path) for path in exclude}
+    cache_path = index_cache_path(folder_path) if cache else None
+    old_index = load_index(cache_path) if cache else {}
+    new_index = {} if recursive else dict(old_index)  # A flat scan keeps the sub-folder entries of earlier walks
+    rescanned = False
+
+    pending = [""]
+    while pending:
+        relative = pending.pop()
+        path = os.path.join(folder_path, relative) if relative else folder_path
+        if relative and os.path.abspath(path) in excluded:
+            continue
+
+        # Stat before listing: a change made during the listing leaves a newer mtime than the one recorded
+        mtime = os.stat(path).st_mtime_ns
+        cached = old_index.get(relative)
+        if cached is not None and cached["mtime"] == mtime:
+            files, folders = cached["files"], cached["folders"]
+            prefix = _join(relative, "")
+            yield from [prefix + name for name in files if name.lower().endswith(extensions)]
+        else:
+            rescanned = True
+            files, folders = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        folders.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                        if entry.name.lower().endswith(extensions):
+                            yield _join(relative, entry.name)
+
+        new_index[relative] = {"mtime": mtime, "files": files, "folders": folders}
+        if recursive:
+            pending.extend(_join(relative, folder) for folder in reversed(folders))
+
+    # Only a completed scan is saved, a generator abandoned half-way leaves the old index in place
+    if cache and (rescanned or new_index.keys() != old_index.keys()):
+        save_index(cache_path, new_index)
@@ -0,0 +1,134 @@
+import io
+import os
+import time
+import cv2
+import numpy as np
+from ProcessingOptions import OUTPUT_FORMATS
+
+
+def atomic_imwrite(path, img, params=None):
+    """cv2.imwrite through a hidden temporary file, so path never holds a half-written image.
+
+    A .npy path gets the raw pixel array with np.save instead. Returns False if the image
+    could not be written.
+    """
+    folder, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    temp_path = os.path.join(folder, f".{stem}.part{ext}")  # Keep the extension, it picks the encoder
+    try:
+        if ext.lower() == ".npy":
+            np.save(temp_path, img)
+        elif not cv2.imwrite(temp_path, img, params or []):
+            return False
+        os.replace(temp_path, path)
+        return True
+    except (OSError, ValueError, cv2.error):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+class ImageEncoding:
+    """Output format and encoder settings for the images a job writes.
+
+    quality applies to JPEG and WebP (1-100, above 100 makes WebP lossless), png_compression
+    is the zlib level 0-9 for PNG; None leaves OpenCV's default. optimize and progressive are
+    the JPEG Huffman-optimisation and progressive-scan flags. "npy" skips encoding altogether
+    and is the fastest way to get frames to disk, at the cost of the largest files.
+    """
+
+    def __init__(self, format="same", quality=None, png_compression=None, optimize=False, progressive=False):
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.format = format
+        self.quality = quality
+        self.png_compression = png_compression
+        self.optimize = optimize
+        self.progressive = progressive
+
+    def extension(self, source_extension):
+        """Extension of an output written from a source with source_extension."""
+        return source_extension if self.format == "same" else "." + self.format
+
+    def params(self, extension):
+        """cv2.imwrite parameters for an output with extension."""
+        extension = extension.lower()
+        params = []
+        if extension in (".jpg", ".jpeg"):
+            if self.quality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+            if self.optimize:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+            if self.progressive:
+                params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        elif extension == ".webp" and self.quality is not None:
+            params += [cv2.IMWRITE_WEBP_QUALITY, int(self.quality)]
+        elif extension == ".png" and self.png_compression is not None:
+            params += [cv2.IMWRITE_PNG_COMPRESSION, int(self.png_compression)]
+        return params
+
+    def write(self, path, img):
+        """Write img to path, whose extension picks the encoder, see atomic_imwrite. Returns False on failure."""
+        return atomic_imwrite(path, img, self.params(os.path.splitext(path)[1]))
+
+    def encode(self, img, extension):
+        """Encode img in memory as it would be written with extension. Returns the bytes."""
+        if extension == ".npy":
+            buffer = io.BytesIO()
+            np.save(buffer, img)
+            return buffer.getvalue()
+        ok, data = cv2.imencode(extension, img, self.params(extension))
+        if not ok:
+            raise ValueError(f"Could not encode as {extension}")
+        return data.tobytes()
+
+    def settings(self):
+        """The settings as a plain dict, for job manifests and reports."""
+        return {"format": self.format, "quality": self.quality, "png_compression": self.png_compression,
+                "optimize": self.optimize, "progressive": self.progressive}
+
+    def describe(self):
+        parts = [self.format]
+        if self.quality is not None:
+            parts.append(f"q{self.quality}")
+        if self.png_compression is not None:
+            parts.append(f"level {self.png_compression}")
+        if self.optimize:
+            parts.append("optimize")
+        if self.progressive:
+            parts.append("progressive")
+        return " ".join(parts)
+
+
+DEFAULT_ENCODING = ImageEncoding()
+
+# Encodings compared by benchmark_encodings when none are given
+BENCHMARK_ENCODINGS = (
+    ImageEncoding("jpg", quality=95), ImageEncoding("jpg", quality=85), ImageEncoding("jpg", quality=75),
+    ImageEncoding("jpg", quality=95, optimize=True), ImageEncoding("jpg", quality=95, progressive=True),
+    ImageEncoding("png", png_compression=0), ImageEncoding("png", png_compression=1),
+    ImageEncoding("png", png_compression=3), ImageEncoding("png", png_compression=9),
+    ImageEncoding("webp", quality=80), ImageEncoding("webp", quality=101),
+    ImageEncoding("bmp"), ImageEncoding("npy"),
+)
+
+
+def benchmark_encodings(images, encodings=BENCHMARK_ENCODINGS):
+    """Encode every decoded image in images with each encoding, in memory.
+
+    Returns one dict per encoding with the mean encode time, the mean size and the size
+    relative to the raw pixels, fastest first.
+    """
+    raw_bytes = sum(img.nbytes for img in images)
+    results = []
+    for encoding in encodings:
+        extension = encoding.extension(".jpg")
+        size = 0
+        start = time.perf_counter()
+        for img in images:
+            size += len(encoding.encode(img, extension))
+        seconds = time.perf_counter() - start
+        results.append({"encoding": encoding.describe(), "settings": encoding.settings(),
+                        "ms_per_image": 1000 * seconds / len(images), "kb_per_image": size / 1024 / len(images),
+                        "size_ratio": size / raw_bytes, "mpixels_per_s": raw_bytes / 3 / 1e6 / seconds})
+    return sorted(results, key=lambda result: result["ms_per_image"])
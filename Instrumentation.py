@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+
+STATS_ENV = "CVHELPER_STATS"  # Path of the JSON report the GUI workers write, enables their instrumentation
+PROFILE_ENV = "CVHELPER_PROFILE"  # Path of the cProfile dump the GUI workers write
+
+BYTE_COUNTERS = ("bytes_read", "bytes_written")
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullStats:
+    """Stand-in used while instrumentation is off. Every call is a no-op."""
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def add_time(self, stage, seconds, calls=1):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def sample_queue(self, name, depth):
+        pass
+
+    def merge(self, snapshot):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class _Timer:
+    __slots__ = ("stats", "stage", "start")
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class RunStats:
+    """Per-stage timers, counters and queue depths of one run. Safe to update from several threads.
+
+    Stage times are summed over every thread and process that reported them, so with parallel
+    workers they can add up to more than the wall time.
+    """
+    enabled = True
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [calls, seconds]
+        self.counters = {}
+        self.queues = {}  # queue -> [samples, summed depth, max depth]
+
+    def timer(self, stage):
+        """Context manager adding the time spent in its block to stage."""
+        return _Timer(self, stage)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def sample_queue(self, name, depth):
+        with self.lock:
+            entry = self.queues.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += depth
+            entry[2] = max(entry[2], depth)
+
+    def snapshot(self):
+        """Plain-data copy of the measurements, to send back from a worker process."""
+        with self.lock:
+            return {"stages": {stage: list(entry) for stage, entry in self.stages.items()},
+                    "counters": dict(self.counters),
+                    "queues": {name: list(entry) for name, entry in self.queues.items()}}
+
+    def merge(self, snapshot):
+        """Add a snapshot taken in a worker process or thread."""
+        if not snapshot:
+            return
+        for stage, (calls, seconds) in snapshot["stages"].items():
+            self.add_time(stage, seconds, calls)
+        for name, amount in snapshot["counters"].items():
+            self.count(name, amount)
+        with self.lock:
+            for name, (samples, total, largest) in snapshot["queues"].items():
+                entry = self.queues.setdefault(name, [0, 0, 0])
+                entry[0] += samples
+                entry[1] += total
+                entry[2] = max(entry[2], largest)
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def wall_time(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self):
+        """The measurements as a JSON-serialisable dict, with throughput per counter."""
+        wall = self.wall_time()
+        with self.lock:
+            stages = {stage: {"calls": calls, "seconds": round(seconds, 6),
+                              "ms_per_call": round(1000 * seconds / calls, 4) if calls else 0.0}
+                      for stage, (calls, seconds) in self.stages.items()}
+            counters = dict(self.counters)
+            queues = {name: {"mean_depth": round(total / samples, 2) if samples else 0.0, "max_depth": largest}
+                      for name, (samples, total, largest) in self.queues.items()}
+        throughput = {}
+        for name, amount in counters.items():
+            if name in BYTE_COUNTERS:
+                throughput[f"{name}_mb_per_s"] = round(amount / 1e6 / wall, 3) if wall else 0.0
+            else:
+                throughput[f"{name}_per_s"] = round(amount / wall, 3) if wall else 0.0
+        return {"run": self.name, "wall_seconds": round(wall, 6), "stages": stages, "counters": counters,
+                "throughput": throughput, "queues": queues}
+
+    def summary(self):
+        """Human-readable end-of-run summary."""
+        report = self.report()
+        lines = [f"Performance summary ({report['run']}, {report['wall_seconds']:.2f} s):"]
+        for stage, entry in sorted(report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"  {stage:<14}{entry['calls']:>9} calls {entry['seconds']:>9.3f} s "
+                         f"{entry['ms_per_call']:>9.3f} ms/call")
+        for name, amount in report["counters"].items():
+            if name in BYTE_COUNTERS:
+                lines.append(f"  {name}: {amount / 1e6:.1f} MB ({report['throughput'][name + '_mb_per_s']} MB/s)")
+            else:
+                lines.append(f"  {name}: {amount} ({report['throughput'][name + '_per_s']}/s)")
+        for name, entry in report["queues"].items():
+            lines.append(f"  queue {name}: mean depth {entry['mean_depth']}, max {entry['max_depth']}")
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """Capture a cProfile of the calling thread into path, or do nothing if path is empty."""
+    if not path:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+def stats_from_env(name):
+    """Per-stage timings for a GUI worker: a RunStats if the CVHELPER_STATS environment variable is set.
+
+    Otherwise NULL_STATS, so nothing is measured.
+    """
+    return RunStats(name) if os.environ.get(STATS_ENV) else NULL_STATS
+
+
+def finish_stats(stats, log_callback, report_path=None):
+    """Stop stats, log its summary and write its JSON report to report_path (default: $CVHELPER_STATS)."""
+    if not stats.enabled:
+        return
+    stats.stop()
+    log_callback(stats.summary())
+    report_path = report_path or os.environ.get(STATS_ENV)
+    if report_path:
+        stats.write_report(report_path)
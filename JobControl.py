@@ -0,0 +1,59 @@
+import threading
+import multiprocessing
+
+
+class Cancelled(Exception):
+    """Raised inside a processing core once its job has been cancelled."""
+
+
+class JobToken:
+    """Cooperative cancel and pause flags shared between a running job and whoever controls it.
+
+    The job calls check() between units of work, which blocks while paused and raises
+    Cancelled once cancelled. The events default to threading.Event; pass multiprocessing
+    events to control jobs running in other processes.
+    """
+
+    def __init__(self, cancel_event=None, run_event=None):
+        self.cancel_event = cancel_event or threading.Event()
+        self.run_event = run_event or threading.Event()
+        self.run_event.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.run_event.set()  # Wake a paused job so it can see the cancel
+
+    def pause(self):
+        self.run_event.clear()
+
+    def resume(self):
+        self.run_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self.run_event.is_set()
+
+    def check(self):
+        """Wait while the job is paused, then raise Cancelled if it has been cancelled."""
+        self.run_event.wait()
+        if self.cancel_event.is_set():
+            raise Cancelled()
+
+
+def check(token):
+    """token.check() for an optional token."""
+    if token is not None:
+        token.check()
+
+
+def spawn_context():
+    """The multiprocessing context every process pool is created with.
+
+    Spawn rather than fork so the children never inherit the GUI's Qt state.
+    """
+    return multiprocessing.get_context("spawn")
+
@@ -0,0 +1,59 @@
+from PySide6 import QtWidgets
+
+BUTTON_STYLE = """
+    QPushButton {
+        font-size: 16px;
+        border: 2px solid black;
+        padding: 5px;
+        background-color: #f0f0f0;
+        color: black;
+    }
+
+    QPushButton:disabled {
+        background-color: #d3d3d3;  /* Greyed-out background */
+        color: #a0a0a0;  /* Greyed-out text */
+        border: 2px solid #a0a0a0;  /* Greyed-out border */
+    }
+"""
+
+
+class JobControlWidget(QtWidgets.QWidget):
+    """Pause/Resume and Cancel buttons driving the JobToken of a running worker."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.pause_button = QtWidgets.QPushButton("Pause")
+        self.pause_button.setStyleSheet(BUTTON_STYLE)
+        self.pause_button.clicked.connect(self.toggle_pause)
+        layout.addWidget(self.pause_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.setStyleSheet(BUTTON_STYLE)
+        self.cancel_button.clicked.connect(self.cancel)
+        layout.addWidget(self.cancel_button)
+
+        self.set_token(None)
+
+    def set_token(self, token):
+        """Control token, or disable the buttons when no job is running (None)."""
+        self.token = token
+        self.pause_button.setText("Pause")
+        self.pause_button.setEnabled(token is not None)
+        self.cancel_button.setEnabled(token is not None)
+
+    def toggle_pause(self):
+        if self.token.paused:
+            self.token.resume()
+            self.pause_button.setText("Pause")
+        else:
+            self.token.pause()
+            self.pause_button.setText("Resume")
+
+    def cancel(self):
+        self.token.cancel()
+        # The job stops at its next check, the buttons stay off until set_token is called again
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = ".cvhelper_manifest.jsonl"
+
+
+def params_hash(params):
+    """Short, stable hash of the parameters that decide a job's output."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class JobManifest:
+    """Record of the sources a job has finished in an output folder, so a rerun can skip them.
+
+    Every finished source appends one JSON line with its path, size, mtime, the parameter hash
+    and the outputs it produced. The newest line for a source wins, and a line cut short by a
+    crash is ignored, so the file is always safe to resume from.
+    """
+
+    def __init__(self, output_folder, params):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_FILE)
+        self.params_hash = params_hash(params)
+        self.entries = {}
+        self.file = None
+
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path) as manifest_file:
+                for line in manifest_file:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["source"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Partial line from an interrupted run
+        # Reruns keep appending, drop superseded lines once they make up most of the file
+        if lines > 2 * len(self.entries) + 100:
+            self.compact()
+
+    def is_complete(self, source_path, stat):
+        """True if source_path, unchanged since it was processed with these parameters, still has all its outputs."""
+        entry = self.entries.get(os.path.abspath(source_path))
+        if entry is None or entry["params"] != self.params_hash:
+            return False
+        if (entry["size"], entry["mtime"]) != (stat.st_size, stat.st_mtime_ns):
+            return False
+        return all(os.path.exists(os.path.join(self.output_folder, output)) for output in entry["outputs"])
+
+    def get(self, source_path):
+        return self.entries.get(os.path.abspath(source_path))
+
+    def record(self, source_path, stat, outputs, **extra):
+        """Mark source_path as finished with outputs (relative to the output folder).
+
+        stat must be taken before the source was read, so a source that changes while it is
+        being processed is redone on the next run.
+        """
+        entry = {"source": os.path.abspath(source_path), "size": stat.st_size, "mtime": stat.st_mtime_ns,
+                 "params": self.params_hash, "outputs": list(outputs), **extra}
+        self.entries[entry["source"]] = entry
+        if self.file is None:
+            os.makedirs(self.output_folder, exist_ok=True)
+            self.file = open(self.path, "a")
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()  # A crash loses at most the entry being written
+
+    def compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as manifest_file:
+            for entry in self.entries.values():
+                manifest_file.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
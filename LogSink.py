@@ -0,0 +1,109 @@
+import os
+import time
+import collections
+from PySide6 import QtCore
+from FileScanner import INDEX_CACHE_DIR
+from Instrumentation import NULL_STATS
+
+LOG_DIR = os.path.join(INDEX_CACHE_DIR, "logs")
+MAX_LOG_LINES = 5000  # Lines kept in the log view, older ones only stay in the log file
+KEEP_LOG_FILES = 20
+
+
+class LogSink(QtCore.QObject):
+    """Collects log lines and progress from a worker and shows them about ten times a second.
+
+    append() and progress() only buffer, connect worker signals to them directly. Every
+    interval_ms the buffered lines are added to log_output in one go, with a single scroll,
+    and progress_callback gets the latest progress values only. The view keeps the newest
+    max_lines lines; while a run is active (between start() and finish()) every line also
+    goes to a log file under LOG_DIR. Use clear() rather than log_output.clear().
+    """
+
+    def __init__(self, log_output, progress_callback=None, max_lines=MAX_LOG_LINES, interval_ms=100, parent=None):
+        super().__init__(parent)
+        self.log_output = log_output
+        self.log_output.document().setMaximumBlockCount(max_lines)  # The view drops its oldest lines itself
+        self.progress_callback = progress_callback
+        self.max_lines = max_lines
+        self.pending = collections.deque(maxlen=max_lines)  # Lines older than that would be dropped at once
+        self.latest_progress = None
+        self.lines = 0
+        self.log_file = None
+        self.log_path = None
+        self.stats = NULL_STATS
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def clear(self):
+        self.pending.clear()
+        self.latest_progress = None
+        self.log_output.clear()
+
+    def start(self, name, stats=NULL_STATS):
+        """Start a new log file for a run called name (e.g. "augment"), timing the view updates into stats."""
+        self.finish()
+        self.lines = 0
+        self.stats = stats
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.log_path = os.path.join(LOG_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.log")
+        self.log_file = open(self.log_path, "a", encoding="utf-8")  # Two runs in the same second share a file
+        self.prune_logs()
+
+    def append(self, message):
+        self.pending.append(message)
+        self.lines += 1
+        if self.log_file is not None:
+            self.log_file.write(message + "\n")
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def progress(self, *values):
+        self.latest_progress = values
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """Show the buffered lines and the latest progress now."""
+        if self.latest_progress is not None and self.progress_callback:
+            self.progress_callback(*self.latest_progress)
+        self.latest_progress = None
+        if not self.pending:
+            self.timer.stop()  # Idle until the next message
+            return
+        if self.log_file is not None:
+            self.log_file.flush()
+        with self.stats.timer("gui_log"):
+            self.log_output.setUpdatesEnabled(False)  # Repaint once for the whole batch
+            try:
+                while self.pending:
+                    self.log_output.append(self.pending.popleft())
+            finally:
+                self.log_output.setUpdatesEnabled(True)
+            scroll_bar = self.log_output.verticalScrollBar()
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def finish(self):
+        """Show everything still buffered and close the log file of the run."""
+        self.flush()
+        if self.log_file is None:
+            return
+        if self.lines > self.max_lines:
+            self.append(f"Only the last {self.max_lines} of {self.lines} lines are shown, "
+                        f"the full log is in {self.log_path}")
+            self.flush()
+        self.log_file.close()
+        self.log_file = None
+        self.stats = NULL_STATS
+
+    def prune_logs(self):
+        """Delete all but the newest KEEP_LOG_FILES log files."""
+        logs = sorted((entry for entry in os.scandir(LOG_DIR) if entry.name.endswith(".log")),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in logs[KEEP_LOG_FILES:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
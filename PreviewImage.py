@@ -0,0 +1,20 @@
+import cv2
+from PySide6.QtGui import QImage
+
+
+def shrink_to_fit(img, width, height):
+    """img downscaled to fit within width x height, or img itself if it already fits."""
+    img_height, img_width = img.shape[:2]
+    scale = min(width / img_width, height / img_height, 1.0)
+    if scale < 1.0:
+        img = cv2.resize(img, (max(1, int(img_width * scale)), max(1, int(img_height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    return img
+
+
+def to_qimage(bgr):
+    """An RGB QImage of a BGR image, safe to emit to the GUI thread."""
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    height, width = rgb.shape[:2]
+    # copy() so the QImage owns its pixels once rgb goes out of scope
+    return QImage(rgb.data, width, height, 3 * width, QImage.Format_RGB888).copy()
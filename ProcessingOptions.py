@@ -0,0 +1,32 @@
+"""The named choices the processing cores accept, shared with the cvhelper command line.
+
+Nothing is imported here, so the CLI can build its parser without loading OpenCV or Qt.
+"""
+
+# How each image reaches its class folder. Every mode except "move" leaves the source layout intact.
+SORT_MODES = ("move", "hardlink", "reflink", "symlink", "manifest", "shards")
+
+# "same" keeps the source's format, "bmp" is uncompressed and "npy" dumps the raw pixel array
+OUTPUT_FORMATS = ("same", "jpg", "png", "webp", "bmp", "npy")
+
+# "tar" packs encoded images into WebDataset-style tar shards, "npy" stacks the raw pixels of
+# fixed-size images into one .npy array per shard, with a matching array of class labels
+SHARD_FORMATS = ("tar", "npy")
+DEFAULT_SHARD_MB = 1024
+
+# Resize filters by name, each mapped to the name of its cv2 constant
+INTERPOLATION_CONSTANTS = {
+    "area": "INTER_AREA",
+    "linear": "INTER_LINEAR",
+    "cubic": "INTER_CUBIC",
+    "lanczos": "INTER_LANCZOS4",
+    "nearest": "INTER_NEAREST",
+}
+
+# OpenCV capture backends a video can be opened with, each mapped to the name of its cv2
+# constant; "auto" lets OpenCV choose, which is FFmpeg in most builds
+DECODER_BACKEND_CONSTANTS = {
+    "auto": "CAP_ANY",
+    "ffmpeg": "CAP_FFMPEG",
+    "gstreamer": "CAP_GSTREAMER",
+}
@@ -0,0 +1,204 @@
+import io
+import os
+import json
+import struct
+import tarfile
+import time
+import cv2
+import numpy as np
+from ImageEncoding import DEFAULT_ENCODING
+from ProcessingOptions import DEFAULT_SHARD_MB, SHARD_FORMATS
+
+NPY_HEADER_SIZE = 128  # Room for the largest header, so it can be rewritten in place once the count is known
+
+
+def _npy_header(dtype, shape):
+    """A version 1.0 .npy header padded to NPY_HEADER_SIZE bytes."""
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                   "shape": tuple(shape)})
+    header = header.encode("latin1").ljust(NPY_HEADER_SIZE - 11) + b"\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header
+
+
+class ShardFormat:
+    """How images are packed into shards: the shard format, the shard size and, for "npy", the image size.
+
+    pack() does the per-image work (encoding, or resizing to size) and is safe to call from
+    worker threads and processes; only ShardWriter.add() has to run in one place.
+    size is (width, height); without it "npy" shards take the size of the first image.
+    """
+
+    def __init__(self, format="tar", shard_mb=DEFAULT_SHARD_MB, size=None):
+        if format not in SHARD_FORMATS:
+            raise ValueError(f"Unknown shard format {format!r}, expected one of {', '.join(SHARD_FORMATS)}")
+        self.format = format
+        self.shard_mb = shard_mb
+        self.size = tuple(size) if size else None
+
+    def pack(self, img, extension, encoding=None):
+        """The payload ShardWriter.add() stores for img: its encoded bytes, or the pixel array for "npy"."""
+        if self.format == "npy":
+            if self.size and (img.shape[1], img.shape[0]) != self.size:
+                img = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+            return np.ascontiguousarray(img)
+        return (encoding or DEFAULT_ENCODING).encode(img, extension)
+
+    def settings(self):
+        """The settings as a plain dict, for job manifests and reports."""
+        return {"format": self.format, "shard_mb": self.shard_mb, "size": self.size}
+
+
+class ShardWriter:
+    """Writes images into a few large shards in output_path, in the order they are added.
+
+    Shards are named <prefix>-000000.tar (or .npy) and are written under a temporary name
+    and renamed once full, so a shard file is always complete. Every image gets a line in
+    <prefix>.index.jsonl with its name, shard, position (the byte offset and size of its
+    data in a tar shard, the row of an .npy shard) and label. Labels are class names, stored
+    as their index in classes, which is written to <prefix>.json along with the shard list
+    when the writer is closed. A tar shard also holds a <name>.cls entry per labelled image,
+    and an .npy shard a <prefix>-000000.labels.npy array, -1 for unlabelled images.
+    """
+
+    def __init__(self, output_path, shard_format, prefix="shard", classes=None):
+        os.makedirs(output_path, exist_ok=True)
+        self.output_path = output_path
+        self.format = shard_format
+        self.prefix = prefix
+        self.classes = list(classes or [])
+        self.class_ids = {class_name: index for index, class_name in enumerate(self.classes)}
+        self.shard_bytes = int(shard_format.shard_mb * 1024 * 1024)
+        self.shape = None  # Image shape of "npy" shards, fixed by the first image without a size
+        self.dtype = None
+        self.capacity = None  # Images per "npy" shard
+        self.shards = []  # {"file", "count"} of every finished shard
+        self.count = 0
+        self.file = None
+        self.tar = None
+        self.labels = []
+        self.index = open(os.path.join(output_path, f"{prefix}.index.jsonl"), "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def shard_name(self, number=None):
+        number = len(self.shards) if number is None else number
+        return f"{self.prefix}-{number:06d}.{self.format.format}"
+
+    def label_id(self, label):
+        if label is None:
+            return -1
+        if label not in self.class_ids:
+            self.class_ids[label] = len(self.classes)
+            self.classes.append(label)
+        return self.class_ids[label]
+
+    def write(self, name, img, label=None, encoding=None):
+        """Pack and add a decoded image in one go, see ShardFormat.pack. Returns the bytes written."""
+        return self.add(name, self.format.pack(img, os.path.splitext(name)[1], encoding), label)
+
+    def add(self, name, payload, label=None):
+        """Append a payload from ShardFormat.pack (or an image file's bytes for "tar"). Returns the bytes written."""
+        label_id = self.label_id(label)
+        if self.format.format == "npy":
+            entry, size = self.add_array(payload, label_id)
+        else:
+            entry, size = self.add_bytes(name, payload, label_id)
+        entry.update(name=name, shard=self.shard_name(), label=label_id)
+        self.index.write(json.dumps(entry) + "\n")
+        self.count += 1
+        return size
+
+    def add_bytes(self, name, data, label_id):
+        if self.tar is not None and self.tar.offset + len(data) > self.shard_bytes:
+            self.finish_shard()
+        if self.tar is None:
+            self.file = open(self.part_path(), "wb", buffering=1024 * 1024)
+            self.tar = tarfile.open(fileobj=self.file, mode="w", format=tarfile.PAX_FORMAT)
+            self.labels = []
+        mtime = time.time()
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime = len(data), mtime
+        self.tar.addfile(info, io.BytesIO(data))
+        # The data ends the member, padded to whole blocks
+        offset = self.tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        if label_id >= 0:
+            label = str(label_id).encode("ascii")
+            info = tarfile.TarInfo(os.path.splitext(name)[0] + ".cls")
+            info.size, info.mtime = len(label), mtime
+            self.tar.addfile(info, io.BytesIO(label))
+        self.labels.append(label_id)
+        return {"offset": offset, "size": len(data)}, len(data)
+
+    def add_array(self, img, label_id):
+        if self.shape is None:
+            self.shape = img.shape
+            self.capacity = max(1, self.shard_bytes // img.nbytes)
+        if img.shape != self.shape:
+            if img.ndim != len(self.shape) or img.shape[2:] != self.shape[2:]:
+                raise ValueError(f"Image of shape {img.shape} does not fit an .npy shard of {self.shape} images")
+            img = cv2.resize(img, (self.shape[1], self.shape[0]), interpolation=cv2.INTER_AREA)
+        if self.file is not None and len(self.labels) >= self.capacity:
+            self.finish_shard()
+        if self.file is None:
+            self.file = open(self.part_path(), "wb", buffering=1024 * 1024)
+            self.dtype = img.dtype
+            self.file.write(_npy_header(self.dtype, (0,) + self.shape))
+            self.labels = []
+        self.file.write(memoryview(np.ascontiguousarray(img)).cast("B"))
+        self.labels.append(label_id)
+        return {"row": len(self.labels) - 1}, img.nbytes
+
+    def part_path(self):
+        return os.path.join(self.output_path, "." + self.shard_name() + ".part")
+
+    def finish_shard(self):
+        """Close the current shard and give it its final name."""
+        if self.file is None:
+            return
+        name = self.shard_name()
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+        else:
+            self.file.seek(0)
+            self.file.write(_npy_header(self.dtype, (len(self.labels),) + self.shape))  # The real image count
+            labels_path = os.path.join(self.output_path, f"{os.path.splitext(name)[0]}.labels.npy")
+            np.save(labels_path + ".part.npy", np.array(self.labels, dtype=np.int32))
+            os.replace(labels_path + ".part.npy", labels_path)
+        self.file.close()
+        self.file = None
+        os.replace(self.part_path(), os.path.join(self.output_path, name))
+        self.shards.append({"file": name, "count": len(self.labels)})
+        self.labels = []
+
+    def close(self):
+        """Finish the last shard and write the index and the <prefix>.json summary."""
+        if self.index.closed:
+            return
+        self.finish_shard()
+        self.index.close()
+        summary = {"format": self.format.format, "count": self.count, "shards": self.shards, "classes": self.classes,
+                   "shape": list(self.shape) if self.shape else None, "index": os.path.basename(self.index.name)}
+        summary_path = os.path.join(self.output_path, f"{self.prefix}.json")
+        with open(summary_path + ".part", "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        os.replace(summary_path + ".part", summary_path)
+
+
+def load_npy_shards(output_path, prefix="shard"):
+    """Memory-map the .npy shards a ShardWriter wrote. Returns [(images, labels)] and the class names.
+
+    The image arrays are read-only views of the files, nothing is read until it is used.
+    """
+    with open(os.path.join(output_path, f"{prefix}.json"), encoding="utf-8") as summary_file:
+        summary = json.load(summary_file)
+    shards = []
+    for shard in summary["shards"]:
+        images = np.load(os.path.join(output_path, shard["file"]), mmap_mode="r")
+        labels = np.load(os.path.join(output_path, f"{os.path.splitext(shard['file'])[0]}.labels.npy"))
+        shards.append((images, labels))
+    return shards, summary["classes"]
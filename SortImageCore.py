@@ -0,0 +1,248 @@
+import os
+import shutil
+import concurrent.futures
+import cv2
+import pandas as pd
+from JobControl import check
+from Instrumentation import NULL_STATS
+from ShardWriter import ShardFormat, ShardWriter
+from ProcessingOptions import SORT_MODES
+
+ANNOTATIONS_FILE = "_annotations.csv"
+FICLONE = 0x40049409  # Linux ioctl that clones a file's data blocks (btrfs, XFS, bcachefs)
+
+
+def reflink_file(src, dest):
+    """Clone src to dest as a copy-on-write reflink. Falls back to a full copy where unsupported.
+
+    Returns True if a reflink was made.
+    """
+    try:
+        import fcntl
+        with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except (ImportError, OSError):
+        shutil.copy2(src, dest)
+        return False
+
+
+def transfer_file(src, dest, mode):
+    """Place src at dest according to mode. Returns False only for a reflink that fell back to a copy."""
+    if mode == "move":
+        shutil.move(src, dest)
+        return True
+    # Non-destructive modes are safe to re-run, keep whatever an earlier run created
+    if os.path.lexists(dest):
+        return True
+    if mode == "hardlink":
+        os.link(src, dest)
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(src), dest)
+    elif mode == "reflink":
+        return reflink_file(src, dest)
+    return True
+
+
+def annotation_folders(folder_path):
+    """Return the folders to sort: folder_path itself if it holds the images, else its sub-folders."""
+    check = os.listdir(folder_path)
+    if ANNOTATIONS_FILE in check or (check and check[0].endswith((".jpg", ".png"))):
+        return [folder_path]
+    return [os.path.join(folder_path, folder) for folder in check if not "." in folder]
+
+
+def read_annotations(csvPath, chunksize=100_000):
+    """Yield DataFrame chunks of distinct (filename, class) rows from an _annotations.csv.
+
+    Only the two needed columns are parsed, class as a categorical, and the file is read
+    chunksize rows at a time. Multi-box rows repeat a filename, only its first class is
+    kept, so memory follows the number of images rather than the number of boxes.
+    """
+    seen = set()
+    for chunk in pd.read_csv(csvPath, usecols=["filename", "class"],
+                             dtype={"filename": str, "class": "category"}, chunksize=chunksize):
+        chunk = chunk.drop_duplicates(subset="filename")
+        # isin() would hash all of seen again for every chunk, a lookup per row does not
+        chunk = chunk[~chunk["filename"].map(seen.__contains__).astype(bool)]
+        seen.update(chunk["filename"])
+        yield chunk
+
+
+def annotation_classes(folders, chunksize=100_000):
+    """Every class named in the _annotations.csv of folders, numbers in numeric order first."""
+    classes = set()
+    for folder in folders:
+        csvPath = os.path.join(folder, ANNOTATIONS_FILE)
+        if os.path.exists(csvPath):
+            for chunk in pd.read_csv(csvPath, usecols=["class"], dtype={"class": str}, chunksize=chunksize):
+                classes.update(chunk["class"].dropna().unique())
+    return sorted(classes, key=lambda name: (not name.isdigit(), int(name) if name.isdigit() else 0, name))
+
+
+def plan_moves(folder, annotations, destination=None):
+    """Group the annotated files that are present in folder by their class folder under destination.
+
+    annotations is an iterable of (filename, class) chunks from read_annotations. A single
+    directory listing replaces a stat per row.
+    """
+    present = {entry.name for entry in os.scandir(folder) if entry.is_file()}
+    moves = {}
+    for chunk in annotations:
+        chunk = chunk[chunk["filename"].map(present.__contains__).astype(bool)]
+        for class_name, group in chunk.groupby("class", sort=False, observed=True):
+            moves.setdefault(os.path.join(destination or folder, f"P{class_name}"), []).extend(group["filename"])
+    return moves
+
+
+def write_manifest(folder, destination, moves, log_callback=print):
+    """Write one P<class>.txt index per class into destination, listing image paths relative to it."""
+    os.makedirs(destination, exist_ok=True)
+    for class_folder_path, filenames in moves.items():
+        index_path = os.path.join(destination, os.path.basename(class_folder_path) + ".txt")
+        with open(index_path + ".part", "w") as index_file:
+            for filename in filenames:
+                index_file.write(os.path.relpath(os.path.join(folder, filename), destination) + "\n")
+        os.replace(index_path + ".part", index_path)  # Never leave a half-written index
+    log_callback(f"Wrote {len(moves)} class index files to {destination}")
+
+
+def pack_folder(folder, destination, moves, shards, classes=None, log_callback=print, progress_callback=None,
+                threads=4, token=None, stats=NULL_STATS):
+    """Pack the planned images of folder into shards in destination, labelled with their class.
+
+    Tar shards hold the image files as they are, .npy shards their decoded pixels. Files
+    are read on threads threads and added in class order; source files are left untouched.
+    """
+    items = [(os.path.join(folder, filename), os.path.join(os.path.basename(class_folder_path), filename),
+              os.path.basename(class_folder_path)[1:])  # Drop the P of the class folder
+             for class_folder_path, filenames in moves.items() for filename in filenames]
+
+    def load(item):
+        src, name, _ = item
+        if shards.format == "tar":
+            with open(src, "rb") as image_file:
+                return image_file.read()
+        img = cv2.imread(src)
+        return None if img is None else shards.pack(img, os.path.splitext(name)[1])
+
+    total = len(items)
+    batch_size = max(1, total // 100)
+    skipped = 0  # Images that could not be decoded
+    with ShardWriter(destination, shards, "shard", classes) as writer, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        for start in range(0, total, batch_size):
+            check(token)
+            batch = items[start:start + batch_size]
+            with stats.timer("transfer"):
+                for (_, name, label), payload in zip(batch, executor.map(load, batch)):
+                    if payload is None:
+                        skipped += 1
+                        continue
+                    stats.count("bytes_written", writer.add(name, payload, label))
+            stats.count("files", len(batch))
+            if progress_callback:
+                progress_callback(min(start + batch_size, total), total)
+
+    if skipped:
+        log_callback(f"{skipped} images could not be read and were left out.")
+    log_callback(f"Packed {writer.count} images of {os.path.basename(folder)} into {len(writer.shards)} "
+                 f"shards in {destination}")
+    return True
+
+
+def sort_folder(folder, log_callback=print, progress_callback=None, move_threads=4, mode="move", destination=None,
+                token=None, stats=None, shards=None, classes=None):
+    """Sort the images of one folder into P<class> sub-folders according to its _annotations.csv.
+
+    mode is one of SORT_MODES: files are moved, hard linked, reflinked (copy-on-write,
+    falling back to a copy), symlinked, only listed in per-class index files ("manifest"),
+    or packed into shards labelled with their class ("shards", see pack_folder) in the
+    ShardFormat shards, tar shards by default. classes fixes the label numbers of the shards.
+    Class folders go into destination, which defaults to the folder itself.
+    Transfers run on move_threads threads, which hides per-file latency on network
+    filesystems. progress_callback receives (files_done, files_total) about a hundred
+    times per folder. token is a JobToken checked between those batches; every file is
+    either fully transferred or untouched when Cancelled is raised.
+    stats is an optional RunStats collecting the time spent planning and transferring.
+    """
+    stats = stats or NULL_STATS
+    if mode not in SORT_MODES:
+        raise ValueError(f"Unknown sort mode {mode!r}, expected one of {', '.join(SORT_MODES)}")
+    csvPath = os.path.join(folder, ANNOTATIONS_FILE)
+    if not os.path.exists(csvPath):
+        log_callback(f"No annotations file found in {os.path.basename(folder)}")
+        return False
+
+    log_callback(f'Processing folder: {os.path.basename(folder)}')  # Log progress
+    destination = destination or folder
+    # Reading the CSV is lazy, so this covers parsing the annotations as well as listing the folder
+    with stats.timer("plan"):
+        moves = plan_moves(folder, read_annotations(csvPath), destination)
+    stats.count("folders")
+
+    if mode == "manifest":
+        with stats.timer("write_manifest"):
+            write_manifest(folder, destination, moves, log_callback)
+        total = sum(len(filenames) for filenames in moves.values())
+        stats.count("files", total)
+        if progress_callback:
+            progress_callback(total, total)
+        return True
+
+    if mode == "shards":
+        return pack_folder(folder, destination, moves, shards or ShardFormat(), classes, log_callback,
+                           progress_callback, move_threads, token, stats)
+
+    # Create each class folder (e.g., P4) once
+    pairs = []
+    for class_folder_path, filenames in moves.items():
+        os.makedirs(class_folder_path, exist_ok=True)
+        pairs.extend((os.path.join(folder, filename), os.path.join(class_folder_path, filename))
+                     for filename in filenames)
+
+    total = len(pairs)
+    batch_size = max(1, total // 100)
+    done = 0
+    copied = 0  # Reflinks that fell back to a full copy
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, move_threads)) as executor:
+        for start in range(0, total, batch_size):
+            check(token)
+            batch = pairs[start:start + batch_size]
+            # Wall time of the batch across all move threads, not the sum of per-file times
+            with stats.timer("transfer"):
+                for linked in executor.map(lambda pair: transfer_file(*pair, mode), batch):
+                    copied += not linked
+            done += len(batch)
+            stats.count("files", len(batch))
+            if progress_callback:
+                progress_callback(done, total)
+
+    if copied:
+        log_callback(f"Reflinks are not supported here, {copied} files were copied instead.")
+    log_callback(f"Images in {os.path.basename(folder)} have been sorted.")
+    return True
+
+
+def sort_images_by_class(folder_path, log_callback=print, progress_callback=None, move_threads=4,
+                         mode="move", output_path=None, token=None, stats=None, shards=None):
+    """Sort every annotated folder under folder_path. Returns the number of folders sorted.
+
+    With output_path set, class folders (or index files) are created under output_path,
+    mirroring the train/test layout, instead of inside each source folder.
+    stats is an optional RunStats shared by every folder (see sort_folder).
+    In "shards" mode the classes of all folders are collected first, so that the shards of
+    train and test number the classes alike.
+    """
+    sorted_folders = 0
+    folders = annotation_folders(folder_path)
+    classes = annotation_classes(folders) if mode == "shards" else None
+    for folder in folders:
+        destination = None
+        if output_path:
+            destination = os.path.normpath(os.path.join(output_path, os.path.relpath(folder, folder_path)))
+        if sort_folder(folder, log_callback, progress_callback, move_threads, mode, destination, token, stats,
+                       shards, classes):
+            sorted_folders += 1
+    log_callback("All folders have been processed.")  # Final message
+    return sorted_folders
@@ -1,8 +1,18 @@
-import os
-import shutil
-import pandas as pd
 from PySide6 import QtWidgets, QtCore
 from pathlib import Path
+from SortImageWorker import SortImageWorker
+from JobControlWidget import JobControlWidget
+from Instrumentation import finish_stats
+from LogSink import LogSink
+
+SORT_MODE_LABELS = {
+    "move": "Move images (reorganises the folder)",
+    "hardlink": "Hard links (same filesystem, no extra space)",
+    "reflink": "Reflinks (copy-on-write, copies where unsupported)",
+    "symlink": "Symbolic links",
+    "manifest": "Index files only (P<class>.txt, images untouched)",
+    "shards": "Tar shards labelled by class (images untouched)",
+}
 class SortImageWidget(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -63,6 +73,18 @@ class SortImageWidget(QtWidgets.QWidget):
         
         # Add the folder layout to the main layout
         main_layout.addLayout(folder_layout)
+        # Sort mode: how images reach their class folders
+        mode_layout = QtWidgets.QHBoxLayout()
+        mode_label = QtWidgets.QLabel("Sort Mode:")
+        mode_label.setStyleSheet("font-size: 16px;")
+        self.mode_combo = QtWidgets.QComboBox(self)
+        self.mode_combo.setStyleSheet("font-size: 16px;")
+        for mode, text in SORT_MODE_LABELS.items():
+            self.mode_combo.addItem(text, mode)
+        mode_layout.addWidget(mode_label)
+        mode_layout.addWidget(self.mode_combo)
+        mode_layout.addStretch()
+        main_layout.addLayout(mode_layout)
         # Sort button
         
         # Third button that is disabled initially
@@ -86,11 +108,21 @@ class SortImageWidget(QtWidgets.QWidget):
         self.sort_button.clicked.connect(self.sort_images_by_class)
         main_layout.addWidget(self.sort_button)
 
+        # Pause / Cancel for the running sort
+        self.job_controls = JobControlWidget(self)
+        main_layout.addWidget(self.job_controls)
+
+        # Progress bar
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        self.progress_bar.setValue(0)
+        main_layout.addWidget(self.progress_bar)
+
         # Output log for showing progress (QTextEdit)
         self.log_output = QtWidgets.QTextEdit()
         self.log_output.setReadOnly(True)  # Make it read-only
         self.log_output.setStyleSheet("font-size: 14px;")
         main_layout.addWidget(self.log_output)
+        self.log_sink = LogSink(self.log_output, self.update_progress_bar, parent=self)
 
     
     
@@ -112,45 +144,34 @@ class SortImageWidget(QtWidgets.QWidget):
             self.sort_button.setEnabled(True)
 
     def sort_images_by_class(self, folderPath):
+        """Start sorting in a separate thread."""
         folderPath = self.foldername.text()
-        check = os.listdir(folderPath)
-        self.log_output.clear()
-        self.log_output.append(f"Sorting Images from <b>{folderPath}</b><br>")
-        if(check[0].endswith(".jpg") or check[0].endswith(".png")):
-            folders = [folderPath]
-        else:
-            folders = [folder for folder in check if not "." in folder] 
+        self.log_sink.clear()
+        self.progress_bar.setValue(0)
 
-        for folder in folders:
-            csvPath = os.path.join(folderPath, folder, '_annotations.csv')
-            
-            if os.path.exists(csvPath):
-                df = pd.read_csv(csvPath)
-                self.log_output.append(f'Processing folder: {folder}')  # Log progress
-                QtWidgets.QApplication.processEvents()
-                for index, row in df.iterrows():
-                    filename = row['filename']
-                    class_name = row['class']
-                    
-                    # Create class folder (e.g., P4) if it doesn't exist
-                    class_folder = f'P{class_name}'
-                    class_folder_path = os.path.join(folderPath, folder, class_folder)
-                    if not os.path.exists(class_folder_path):
-                        os.makedirs(class_folder_path)
-                    
-                    # Source and destination paths
-                    src_file = os.path.join(folderPath, folder, filename)
-                    dest_file = os.path.join(class_folder_path, filename)
-                    
-                    if os.path.exists(src_file):
-                        shutil.move(src_file, dest_file)
-                
-                self.log_output.append(f"Images in {folder} have been sorted.")
-                QtWidgets.QApplication.processEvents()  # Log sorted message
-                self.log_output.append("All folders have been processed.")  # Final message
-            else:
-                self.log_output.append(f"No annotations file found in {folder}")
-                QtWidgets.QApplication.processEvents()
+        # Create and start the worker thread
+        self.worker = SortImageWorker(folderPath, mode=self.mode_combo.currentData())
+        self.log_sink.start("sort", self.worker.stats)
+        self.log_sink.append(f"Sorting Images from <b>{folderPath}</b><br>")
 
-        
-        QtWidgets.QApplication.processEvents()
\ No newline at end of file
+        # Connect signals to update the log and handle completion
+        self.worker.log_signal.connect(self.log_sink.append)
+        self.worker.progress_signal.connect(self.log_sink.progress)
+        self.worker.finished_signal.connect(self.sorting_finished)
+
+        # Keep the button disabled while the worker is running
+        self.sort_button.setEnabled(False)
+        self.job_controls.set_token(self.worker.token)
+        self.worker.start()
+
+    def sorting_finished(self):
+        self.log_sink.flush()  # Counted in the stats summary
+        finish_stats(self.worker.stats, self.log_sink.append)
+        self.log_sink.finish()
+        self.job_controls.set_token(None)
+        self.check_both_buttons_clicked()
+
+    def update_progress_bar(self, value, maximum):
+        """Update the progress bar with the given value."""
+        self.progress_bar.setMaximum(max(1, maximum))
+        self.progress_bar.setValue(value)
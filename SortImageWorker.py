@@ -0,0 +1,34 @@
+import os
+from PySide6.QtCore import QThread, Signal
+from SortImageCore import sort_images_by_class
+from JobControl import Cancelled, JobToken
+from Instrumentation import PROFILE_ENV, profiled, stats_from_env
+
+class SortImageWorker(QThread):
+    log_signal = Signal(str)  # Signal to emit log messages
+    finished_signal = Signal()  # Signal to emit when the process is finished
+    progress_signal = Signal(int, int)  # Signal to emit (files moved, files total) for the current folder
+
+    def __init__(self, folder_path, move_threads=4, mode="move", output_path=None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.move_threads = move_threads  # Threads moving files, more helps on network filesystems
+        self.mode = mode  # One of SortImageCore.SORT_MODES
+        self.output_path = output_path  # Where class folders go, None sorts in place
+        self.token = JobToken()  # Pauses or cancels the sort between batches of files
+        self.stats = stats_from_env("sort")
+
+    def run(self):
+        try:
+            with profiled(os.environ.get(PROFILE_ENV)):
+                sort_images_by_class(self.folder_path, log_callback=self.log_signal.emit,
+                                     progress_callback=self.progress_signal.emit,
+                                     move_threads=self.move_threads, mode=self.mode,
+                                     output_path=self.output_path, token=self.token, stats=self.stats)
+        except Cancelled:
+            self.log_signal.emit("Sorting cancelled.")
+        except Exception as e:
+            self.log_signal.emit(f"Sorting failed: {e}")
+
+        # Emit finished signal when done
+        self.finished_signal.emit()
@@ -0,0 +1,139 @@
+import os
+import time
+import cv2
+from ProcessingOptions import DECODER_BACKEND_CONSTANTS
+
+DECODER_BACKENDS = {name: getattr(cv2, constant) for name, constant in DECODER_BACKEND_CONSTANTS.items()}
+# Requested with CAP_PROP_HW_ACCELERATION, on OpenCV builds that have it (4.5.2 and later)
+HW_ACCELERATIONS = {
+    "none": getattr(cv2, "VIDEO_ACCELERATION_NONE", 0),
+    "any": getattr(cv2, "VIDEO_ACCELERATION_ANY", 1),
+}
+HW_ACCELERATION_NAMES = {
+    getattr(cv2, name, None): label for name, label in (
+        ("VIDEO_ACCELERATION_NONE", "cpu"), ("VIDEO_ACCELERATION_ANY", "any"), ("VIDEO_ACCELERATION_D3D11", "d3d11"),
+        ("VIDEO_ACCELERATION_VAAPI", "vaapi"), ("VIDEO_ACCELERATION_MFX", "mfx"))
+}
+
+
+def available_backends():
+    """The DECODER_BACKENDS names this OpenCV build can open files with."""
+    registered = set(cv2.videoio_registry.getStreamBackends())
+    return [name for name, backend in DECODER_BACKENDS.items() if backend == cv2.CAP_ANY or backend in registered]
+
+
+class VideoDecoding:
+    """Backend, decoder thread count and hardware acceleration used to open videos.
+
+    threads is the decoder's thread count, None for the backend's default (FFmpeg uses every
+    core). hw_acceleration "any" asks for whatever hardware decoder the backend can find;
+    machines without one decode on the CPU. The defaults open videos exactly as a plain
+    cv2.VideoCapture(path) does.
+    """
+
+    def __init__(self, backend="auto", threads=None, hw_acceleration="none"):
+        if backend not in DECODER_BACKENDS:
+            raise ValueError(f"Unknown decoder backend {backend!r}, expected one of {', '.join(DECODER_BACKENDS)}")
+        if hw_acceleration not in HW_ACCELERATIONS:
+            raise ValueError(f"Unknown hardware acceleration {hw_acceleration!r}, "
+                             f"expected one of {', '.join(HW_ACCELERATIONS)}")
+        self.backend = backend
+        self.threads = threads
+        self.hw_acceleration = hw_acceleration
+
+    def params(self, hw_acceleration=True):
+        """cv2.VideoCapture open parameters, without the hardware request if hw_acceleration is False."""
+        params = []
+        if self.threads is not None and hasattr(cv2, "CAP_PROP_N_THREADS"):
+            params += [cv2.CAP_PROP_N_THREADS, int(self.threads)]
+        if hw_acceleration and self.hw_acceleration != "none" and hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+            params += [cv2.CAP_PROP_HW_ACCELERATION, HW_ACCELERATIONS[self.hw_acceleration]]
+        return params
+
+    def open(self, video_path):
+        """A cv2.VideoCapture of video_path with these settings.
+
+        If the video cannot be opened that way it is opened again without hardware
+        acceleration, then with OpenCV's default backend, so a setting that does not work
+        on this machine never stops an extraction. Check isOpened() as usual.
+        """
+        backend = DECODER_BACKENDS[self.backend]
+        if backend == cv2.CAP_ANY and not self.params():
+            return cv2.VideoCapture(video_path)
+        attempts = [(backend, self.params())]
+        if self.hw_acceleration != "none":
+            attempts.append((backend, self.params(hw_acceleration=False)))  # CPU fallback
+        if backend != cv2.CAP_ANY:
+            attempts.append((cv2.CAP_ANY, self.params(hw_acceleration=False)))
+        for backend, params in attempts:
+            video_capture = cv2.VideoCapture(video_path, backend, params)
+            if video_capture.isOpened():
+                return video_capture
+            video_capture.release()
+        return video_capture
+
+    def settings(self):
+        """The settings as a plain dict, for reports."""
+        return {"backend": self.backend, "threads": self.threads, "hw_acceleration": self.hw_acceleration}
+
+    def describe(self):
+        parts = [self.backend, f"{self.threads} threads" if self.threads is not None else "default threads"]
+        if self.hw_acceleration != "none":
+            parts.append(f"hw {self.hw_acceleration}")
+        return ", ".join(parts)
+
+
+DEFAULT_DECODING = VideoDecoding()
+
+
+def decoding_candidates():
+    """The configurations probe_decoders tries: every available backend with default, single and
+    half the cores' decoder threads, on the CPU and with hardware acceleration."""
+    cores = os.cpu_count() or 1
+    backends = [backend for backend in available_backends() if backend != "auto"] or ["auto"]  # auto is one of them
+    thread_counts = [None] + sorted({1, max(1, cores // 2)})
+    accelerations = ["none", "any"] if hasattr(cv2, "CAP_PROP_HW_ACCELERATION") else ["none"]
+    return [VideoDecoding(backend, threads, hw_acceleration)
+            for backend in backends for hw_acceleration in accelerations for threads in thread_counts]
+
+
+def probe_decoders(video_path, frames=100, candidates=None, warmup=5):
+    """Decode the first frames of video_path with each configuration in candidates and time it.
+
+    Returns one dict per configuration that opened the video, fastest first: its settings,
+    frames per second, the backend OpenCV actually used and whether hardware decoding was in
+    effect. Configurations that fall back to another backend or to the CPU are left out, as
+    they duplicate one that is timed anyway.
+    """
+    results = []
+    for decoding in candidates or decoding_candidates():
+        backend = DECODER_BACKENDS[decoding.backend]
+        video_capture = cv2.VideoCapture(video_path, backend, decoding.params())
+        try:
+            if not video_capture.isOpened():
+                continue
+            backend_name = video_capture.getBackendName()
+            acceleration = (int(video_capture.get(cv2.CAP_PROP_HW_ACCELERATION))
+                            if hasattr(cv2, "CAP_PROP_HW_ACCELERATION") else 0)
+            if decoding.hw_acceleration != "none" and acceleration == HW_ACCELERATIONS["none"]:
+                continue  # No hardware decoder, the same as its CPU twin
+            for _ in range(warmup):  # Opening and the first frames cost the same whatever comes after
+                video_capture.grab()
+            decoded = 0
+            start = time.perf_counter()
+            while decoded < frames and video_capture.read()[0]:
+                decoded += 1
+            seconds = time.perf_counter() - start
+        finally:
+            video_capture.release()
+        if decoded:
+            results.append({"decoding": decoding, "fps": decoded / seconds, "frames": decoded,
+                            "backend": backend_name,
+                            "hw_acceleration": HW_ACCELERATION_NAMES.get(acceleration, str(acceleration))})
+    return sorted(results, key=lambda result: result["fps"], reverse=True)
+
+
+def fastest_decoding(video_path, frames=100):
+    """The VideoDecoding that decodes video_path fastest on this machine, DEFAULT_DECODING if none opens it."""
+    results = probe_decoders(video_path, frames)
+    return results[0]["decoding"] if results else DEFAULT_DECODING
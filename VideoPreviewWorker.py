@@ -0,0 +1,125 @@
+import bisect
+import threading
+from collections import OrderedDict
+import cv2
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QImage
+from VideoDecoding import DEFAULT_DECODING
+from PreviewImage import shrink_to_fit, to_qimage
+
+class VideoPreviewWorker(QThread):
+    frame_ready = Signal(int, QImage)  # Signal to emit (frame number, downscaled preview)
+
+    def __init__(self, video_path, preview_size, total_frames, cache_size=128, thumbnail_count=100, decoding=None):
+        super().__init__()
+        self.video_path = video_path
+        self.decoding = decoding or DEFAULT_DECODING  # VideoDecoding the preview is decoded with
+        self.preview_width, self.preview_height = preview_size
+        self.total_frames = total_frames
+        self.cache = OrderedDict()  # LRU cache of frame number -> QImage
+        self.cache_lock = threading.Lock()  # The GUI thread reads the cache, this thread fills it
+        self.cache_size = cache_size
+        # Evenly spaced frames decoded in idle time so scrubbing has something to show at once
+        step = max(1, total_frames // thumbnail_count) if thumbnail_count else 0
+        self.thumbnail_frames = list(range(0, total_frames, step)) if step else []
+        self.thumbnails = {}
+        self.condition = threading.Condition()
+        self.pending = None  # Only the latest requested frame is ever served
+        self.stopping = False
+        self.position = None  # Frame the capture will return on its next read()
+
+    def request_frame(self, frame_number):
+        """Ask for a preview of frame_number. Replaces any request that has not started yet."""
+        frame_number = max(0, min(frame_number, self.total_frames - 1))
+        cached = self.cached(frame_number)
+        if cached is not None:
+            self.frame_ready.emit(frame_number, cached)
+            return
+        with self.condition:
+            self.pending = frame_number
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        video_capture = self.decoding.open(self.video_path)
+        self.position = 0
+        try:
+            while True:
+                with self.condition:
+                    while self.pending is None and not self.stopping and len(self.thumbnails) == len(self.thumbnail_frames):
+                        self.condition.wait()
+                    if self.stopping:
+                        break
+                    frame_number, self.pending = self.pending, None
+
+                if frame_number is not None:
+                    self.serve(video_capture, frame_number)
+                else:
+                    # Nothing requested: build one more thumbnail, then check for requests again
+                    thumbnail_frame = self.thumbnail_frames[len(self.thumbnails)]
+                    image = self.decode(video_capture, thumbnail_frame)
+                    self.thumbnails[thumbnail_frame] = image
+                    if image is not None:
+                        self.store(thumbnail_frame, image)
+        finally:
+            video_capture.release()
+
+    def serve(self, video_capture, frame_number):
+        cached = self.cached(frame_number)
+        if cached is None:
+            # Show the nearest thumbnail straight away while the exact frame decodes
+            nearest = self.nearest_thumbnail(frame_number)
+            if nearest is not None:
+                self.frame_ready.emit(frame_number, nearest)
+            cached = self.decode(video_capture, frame_number)
+            if cached is None:
+                return
+            self.store(frame_number, cached)
+        self.frame_ready.emit(frame_number, cached)
+
+    def nearest_thumbnail(self, frame_number):
+        built = [frame for frame in self.thumbnail_frames[:len(self.thumbnails)] if self.thumbnails[frame] is not None]
+        if not built:
+            return None
+        index = bisect.bisect_left(built, frame_number)
+        candidates = built[max(0, index - 1):index + 1]
+        return self.thumbnails[min(candidates, key=lambda frame: abs(frame - frame_number))]
+
+    def decode(self, video_capture, frame_number):
+        """Decode frame_number into a downscaled RGB QImage, or None if it cannot be read."""
+        # Short jumps forward are cheaper to grab through than to seek
+        if self.position is None or not 0 <= frame_number - self.position <= 30:
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            self.position = frame_number
+        while self.position < frame_number:
+            if not video_capture.grab():
+                self.position = None
+                return None
+            self.position += 1
+        success, frame = video_capture.read()
+        if not success:
+            self.position = None
+            return None
+        self.position += 1
+
+        # Downscale before the colour conversion so both only touch preview-sized pixels
+        return to_qimage(shrink_to_fit(frame, self.preview_width, self.preview_height))
+
+    def cached(self, frame_number):
+        with self.cache_lock:
+            image = self.cache.get(frame_number)
+            if image is not None:
+                self.cache.move_to_end(frame_number)
+            return image
+
+    def store(self, frame_number, image):
+        with self.cache_lock:
+            self.cache[frame_number] = image
+            self.cache.move_to_end(frame_number)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
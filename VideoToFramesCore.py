@@ -0,0 +1,553 @@
+import os
+import math
+import queue
+import threading
+import time
+import collections
+import concurrent.futures
+import cv2
+from FileScanner import scan_files
+from JobManifest import JobManifest
+from JobControl import Cancelled, JobToken, check, spawn_context
+from ImageEncoding import ImageEncoding
+from ShardWriter import ShardWriter
+from VideoDecoding import DEFAULT_DECODING
+from Instrumentation import NULL_STATS, RunStats
+from ProcessingOptions import INTERPOLATION_CONSTANTS
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+
+FRAME_ENCODING = ImageEncoding("jpg")  # Frames are written as JPEG unless an encoding is given
+
+# Resampling filters for resized frames; "area" is the sharpest when shrinking
+INTERPOLATIONS = {name: getattr(cv2, constant) for name, constant in INTERPOLATION_CONSTANTS.items()}
+
+
+def create_folder(folder_name):
+    if not os.path.exists(folder_name):
+        os.makedirs(folder_name)
+
+
+def list_videos(path):
+    """Return path itself if it is a video file, otherwise the videos directly inside it."""
+    if path.lower().endswith(VIDEO_EXTENSIONS):
+        return [path]
+    return [os.path.join(path, filename) for filename in sorted(scan_files(path, VIDEO_EXTENSIONS))]
+
+
+class Throttle:
+    """Lets an action through at most once per interval seconds."""
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.last = 0.0
+
+    def ready(self):
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+
+def default_write_threads():
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def sampling_step(fps, stride=1, target_fps=None, interval=None):
+    """Return the distance in frames between two extracted frames for the chosen sampling mode.
+
+    Only one of stride (every Nth frame), target_fps (output frames per second of video)
+    and interval (seconds between frames) may be given.
+    """
+    modes = [stride not in (None, 1), target_fps is not None, interval is not None]
+    if sum(modes) > 1:
+        raise ValueError("Choose only one of stride, target_fps and interval")
+    if target_fps is not None:
+        if target_fps <= 0:
+            raise ValueError("target_fps must be positive")
+        return max(1.0, fps / target_fps)
+    if interval is not None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        return max(1.0, interval * fps)
+    if stride is not None and stride < 1:
+        raise ValueError("stride must be at least 1")
+    return float(stride or 1)
+
+
+def sampled_frame_count(frame_start, frame_end, step, max_frames=None):
+    """Number of frames sampling will produce between frame_start and frame_end."""
+    count = max(0, math.ceil((frame_end - frame_start) / step))
+    return min(count, max_frames) if max_frames else count
+
+
+def iter_sampled_frames(video_capture, frame_start, frame_end, step=1.0, max_frames=None, seek_threshold=250):
+    """Yield (frame_index, image) for every step-th frame in [frame_start, frame_end).
+
+    Frames between samples are skipped with grab(), which avoids the colour conversion
+    and copy of retrieve(). Gaps of seek_threshold frames or more seek instead, letting
+    the demuxer jump to the nearest keyframe rather than walking through every packet.
+    """
+    video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_start)
+    position = frame_start  # Index of the next frame read() would return
+    next_sample = float(frame_start)
+    sampled = 0
+    while not max_frames or sampled < max_frames:
+        target = int(round(next_sample))
+        if target >= frame_end:
+            break
+        if target - position >= seek_threshold:
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        while position < target:
+            if not video_capture.grab():
+                return
+            position += 1
+        success, image = video_capture.read()
+        if not success:
+            return
+        yield target, image
+        position += 1
+        sampled += 1
+        next_sample += step
+
+
+class FrameDeduplicator:
+    """Drops frames that barely differ from the last frame that was kept.
+
+    Frames are compared as size x size grayscale thumbnails. The thumbnail is taken from a
+    strided view of the frame, so even a 4K frame costs around a millisecond.
+    """
+
+    def __init__(self, threshold, size=32):
+        self.threshold = threshold  # Minimum mean absolute difference to keep a frame, in percent
+        self.size = size
+        self.last = None
+
+    def thumbnail(self, image):
+        height, width = image.shape[:2]
+        step = max(1, min(height, width) // (self.size * 4))
+        small = cv2.resize(image[::step, ::step], (self.size, self.size), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def is_duplicate(self, image):
+        thumbnail = self.thumbnail(image)
+        if self.last is not None and cv2.absdiff(thumbnail, self.last).mean() * 100 / 255 < self.threshold:
+            return True
+        self.last = thumbnail
+        return False
+
+
+def clip_roi(roi, width, height):
+    """Clip an (x, y, w, h) region of interest to a width x height frame. Raises ValueError if nothing is left."""
+    x, y, w, h = (int(value) for value in roi)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError(f"Region of interest {tuple(roi)} lies outside the {width}x{height} frame")
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def output_size(width, height, max_side=None, size=None):
+    """(width, height) a width x height frame is resized to, or None to keep it as it is.
+
+    size is an exact (width, height); max_side shrinks the frame, keeping its aspect ratio,
+    until its longer side is at most max_side. Frames are never enlarged to fit max_side.
+    """
+    if size:
+        size = (int(size[0]), int(size[1]))
+        return None if size == (width, height) else size
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    return None
+
+
+def extraction_params(frame_start, frame_end, stride=1, target_fps=None, interval=None, max_frames=None,
+                      dedup_threshold=None, encoding=None, shards=None, roi=None, max_side=None, size=None,
+                      interpolation="area", **_):
+    """The extract_frames settings that decide which frames are written and how, for a JobManifest."""
+    params = {"frame_start": frame_start, "frame_end": frame_end, "stride": stride, "target_fps": target_fps,
+              "interval": interval, "max_frames": max_frames, "dedup_threshold": dedup_threshold,
+              "encoding": (encoding or FRAME_ENCODING).settings()}
+    if shards is not None:
+        params["shards"] = shards.settings()
+    if roi or max_side or size:
+        params.update(roi=roi and list(roi), max_side=max_side, size=size and list(size), interpolation=interpolation)
+    return params
+
+
+def extract_frames(video_path, output_folder, frame_start=0, frame_end=None,
+                   progress_callback=None, log_callback=None,
+                   write_threads=None, queue_size=32, update_interval=0.25,
+                   stride=1, target_fps=None, interval=None, max_frames=None, seek_threshold=250,
+                   dedup_threshold=None, resume=False, token=None, stats=None, encoding=None, shards=None,
+                   roi=None, max_side=None, size=None, interpolation="area", decoding=None):
+    """Write frames [frame_start, frame_end) of a video as images into a sub-folder of output_folder.
+
+    progress_callback receives (frames_done, frames_total); the README describes the other options.
+    Returns (number of frames written, sub-folder path). Raises OSError if the video cannot be
+    opened or decoded, before a resume manifest records it as done.
+    """
+    stats = stats or NULL_STATS
+    output_encoding = encoding or FRAME_ENCODING
+    extension = output_encoding.extension(".jpg")  # "same" has no source image format to keep, use JPEG
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    video_capture = (decoding or DEFAULT_DECODING).open(video_path)
+    try:
+        if not video_capture.isOpened():
+            raise OSError(f"Could not open {video_path}")
+        total_frames, fps, width, height = _capture_info(video_capture)
+        if total_frames <= 0:
+            raise OSError(f"{video_path} reports no frames")
+        if frame_end is None or frame_end > total_frames:
+            frame_end = total_frames
+        crop = clip_roi(roi, width, height) if roi else None
+        if crop:
+            width, height = crop[2:]
+        resize = output_size(width, height, max_side, size)
+        resize_filter = INTERPOLATIONS[interpolation]
+
+        # Create a subfolder using the video name and the start/end times
+        start_seconds = int(frame_start // fps)
+        end_seconds = int(frame_end // fps)
+        subfolder_name = f"{video_name}_{start_seconds}s-{end_seconds}s"
+        video_output_folder = os.path.join(output_folder, subfolder_name)
+        create_folder(video_output_folder)
+
+        step = sampling_step(fps, stride, target_fps, interval)
+        print_total_frames = sampled_frame_count(frame_start, frame_end, step, max_frames)
+
+        manifest = None
+        if resume:
+            manifest = JobManifest(output_folder, extraction_params(frame_start, frame_end, stride, target_fps,
+                                                                    interval, max_frames, dedup_threshold, encoding,
+                                                                    shards, roi, max_side, size, interpolation))
+            source_stat = os.stat(video_path)
+            if manifest.is_complete(video_path, source_stat):
+                manifest.close()
+                if progress_callback:
+                    progress_callback(print_total_frames, print_total_frames)
+                if log_callback:
+                    log_callback(f"{video_name} is already extracted in {video_output_folder}, skipping.")
+                return manifest.get(video_path).get("written", 0), video_output_folder
+
+        if log_callback:
+            log_callback(f"Processing video: {video_name} (up to frame {frame_end})")
+        frame_queue = queue.Queue(maxsize=queue_size)  # Bounds the decoded frames held in memory
+        state = {"written": 0, "skipped": 0, "error": None, "queued": 0, "next": 0}
+        deduplicator = FrameDeduplicator(dedup_threshold) if dedup_threshold else None
+        lock = threading.Lock()
+        shard_writer = ShardWriter(video_output_folder, shards, "frames") if shards is not None else None
+        packed = {}  # Frame number in the queue -> (name, payload) waiting for the frames before it
+
+        def add_to_shards(number, frame_path, image):
+            # Frames are packed in parallel but added to the shards in video order
+            with stats.timer("pack"):
+                payload = shards.pack(image, extension, output_encoding)
+            with lock:
+                packed[number] = (os.path.basename(frame_path), payload)
+                while state["next"] in packed:
+                    with stats.timer("shard_write"):
+                        stats.count("bytes_written", shard_writer.add(*packed.pop(state["next"])))
+                    state["next"] += 1
+                    state["written"] += 1
+
+        def write_frames():
+            while True:
+                item = frame_queue.get()
+                if item is None:
+                    break
+                number, frame_path, image = item
+                try:
+                    if resize:
+                        with stats.timer("resize"):
+                            image = cv2.resize(image, resize, interpolation=resize_filter)
+                    if shard_writer is not None:
+                        add_to_shards(number, frame_path, image)
+                        continue
+                    with stats.timer("imwrite"):
+                        ok = output_encoding.write(frame_path, image)
+                    if not ok:
+                        raise OSError(f"Could not write {frame_path}")
+                    if stats.enabled:
+                        stats.count("bytes_written", os.path.getsize(frame_path))
+                    with lock:
+                        state["written"] += 1
+                except Exception as e:
+                    with lock:
+                        state["error"] = state["error"] or e
+
+        writers = [threading.Thread(target=write_frames, daemon=True)
+                   for _ in range(write_threads or default_write_threads())]
+        for writer in writers:
+            writer.start()
+
+        throttle = Throttle(update_interval)
+
+        def report():
+            written, skipped = state["written"], state["skipped"]
+            if log_callback:
+                duplicates = f" ({skipped} duplicates skipped)" if skipped else ""
+                log_callback(f"Extracting frame {written + skipped}/{print_total_frames}{duplicates}")
+            if progress_callback:
+                progress_callback(written + skipped, print_total_frames)
+
+        frames = iter_sampled_frames(video_capture, frame_start, frame_end, step, max_frames, seek_threshold)
+        try:
+            while True:
+                # Decoding covers the grab() calls between samples as well as the read()
+                with stats.timer("decode"):
+                    item = next(frames, None)
+                if item is None:
+                    break
+                count, image = item
+                if crop:
+                    x, y, w, h = crop
+                    # Copied, a view would keep the whole decoded frame alive while it waits in the queue
+                    image = image[y:y + h, x:x + w].copy()
+                check(token)
+                if state["error"] is not None:
+                    break
+                if deduplicator:
+                    with stats.timer("dedup"):
+                        duplicate = deduplicator.is_duplicate(image)
+                else:
+                    duplicate = False
+                if duplicate:
+                    state["skipped"] += 1
+                else:
+                    frame_filename = f"{video_name}_frame{count}{extension}"
+                    # Time blocked on a full queue means the writers, not the decoder, are the bottleneck
+                    with stats.timer("queue_wait"):
+                        frame_queue.put((state["queued"], os.path.join(video_output_folder, frame_filename), image))
+                    state["queued"] += 1
+                    stats.sample_queue("frames", frame_queue.qsize())
+                if throttle.ready():
+                    report()
+        except Cancelled:
+            # Free the queued frames at once rather than writing them
+            while True:
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    break
+            raise
+        finally:
+            for _ in writers:
+                frame_queue.put(None)
+            for writer in writers:
+                writer.join()
+            if shard_writer is not None:
+                shard_writer.close()
+        if state["error"] is not None:
+            raise state["error"]
+        if print_total_frames and not state["queued"] + state["skipped"]:
+            raise OSError(f"Could not decode any frames of {video_path}")
+        report()
+    finally:
+        video_capture.release()
+
+    written = state["written"]
+    stats.count("frames", written)
+    if state["skipped"]:
+        stats.count("duplicates", state["skipped"])
+    if manifest is not None:
+        manifest.record(video_path, source_stat, [subfolder_name], written=written)
+        manifest.close()
+    if log_callback:
+        if state["skipped"]:
+            log_callback(f"{state['skipped']} near-duplicate frames were skipped.")
+        log_callback(f"\n{written} images are extracted in {video_output_folder}.")
+    return written, video_output_folder
+
+
+def _capture_info(video_capture):
+    """Return (total_frames, fps, width, height) of an open capture as the container reports them."""
+    total_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = video_capture.get(cv2.CAP_PROP_FPS) or 1  # Some containers report 0 fps
+    width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    return total_frames, fps, width, height
+
+
+def probe_video(video_path):
+    """Return (total_frames, fps, width, height) from the container, without decoding any frames."""
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        return _capture_info(video_capture)
+    finally:
+        video_capture.release()
+
+
+def estimate_extraction_memory(width, height, queue_size=32, write_threads=None, roi=None, max_side=None, size=None):
+    """Rough peak bytes held by one extract_frames call: queued frames, frames being written and the decoder.
+
+    Queued frames are cropped to roi, and frames being written are also resized (see output_size).
+    """
+    frame_bytes = width * height * 3
+    if roi:
+        width, height = clip_roi(roi, width, height)[2:]
+    cropped_bytes = width * height * 3
+    resized = output_size(width, height, max_side, size)
+    resized_bytes = resized[0] * resized[1] * 3 if resized else 0
+    return (frame_bytes * 4 + cropped_bytes * queue_size
+            + (cropped_bytes + resized_bytes) * (write_threads or default_write_threads()))
+
+
+_worker_token = None  # JobToken of a process pool worker, set by _init_video_worker
+
+
+def _init_video_worker(token):
+    global _worker_token
+    _worker_token = token
+
+
+def _extract_video_task(video_path, output_folder, frame_start, frame_end, options, messages, instrument=False):
+    """Process pool entry point: extract one video and forward its progress through messages.
+
+    Returns (frames written, sub-folder path, stats snapshot or None).
+    """
+    def progress(done, total):
+        messages.put(("progress", video_path, done, total))
+
+    def log(message):
+        messages.put(("log", video_path, message))
+
+    stats = RunStats(video_path) if instrument else None
+    written, video_output_folder = extract_frames(video_path, output_folder, frame_start, frame_end,
+                                                  progress_callback=progress, log_callback=log,
+                                                  token=_worker_token, stats=stats, **options)
+    return written, video_output_folder, stats.snapshot() if instrument else None
+
+
+def extract_videos(video_paths, output_folder, frame_start=0, frame_end=None, workers=2, max_memory_mb=None,
+                   progress_callback=None, video_progress_callback=None, log_callback=None,
+                   update_interval=0.25, resume=False, token=None, stats=None, **options):
+    """Extract several videos at once, each in its own process.
+
+    At most workers videos (and so decoders) are open at a time, and a video only starts
+    if the estimated memory of all running extractions stays within max_memory_mb. One
+    video always runs even if it alone exceeds the budget. progress_callback receives the
+    aggregate (frames_done, frames_total) and video_progress_callback receives
+    (video_path, frames_done, frames_total). Other options go to extract_frames.
+    resume works as for extract_frames, with the manifest kept by this process alone.
+    token pauses or cancels every running extraction through a process-shared copy of it,
+    and no further video starts while it is paused. Raises Cancelled once they have stopped.
+    stats is an optional RunStats the measurements of every extraction are merged into.
+    Returns a dict of video path to number of frames written.
+    """
+    stats = stats or NULL_STATS
+    manifests = {}  # frame_end -> JobManifest, the settings hash covers the resolved end frame
+    source_stats = {}
+    results = {}
+
+    # Probe every video up front to size the aggregate progress bar and the memory budget
+    plans = collections.deque()
+    totals, done = {}, {}
+    for video_path in video_paths:
+        total_frames, fps, width, height = probe_video(video_path)
+        end = total_frames if frame_end is None else min(frame_end, total_frames)
+        if resume:
+            if end not in manifests:
+                manifests[end] = JobManifest(output_folder, extraction_params(frame_start, end, **options))
+            source_stats[video_path] = os.stat(video_path)
+            if manifests[end].is_complete(video_path, source_stats[video_path]):
+                results[video_path] = manifests[end].get(video_path).get("written", 0)
+                if log_callback:
+                    log_callback(f"{os.path.basename(video_path)} is already extracted, skipping.")
+                continue
+        step = sampling_step(fps, options.get("stride", 1), options.get("target_fps"), options.get("interval"))
+        totals[video_path] = sampled_frame_count(frame_start, end, step, options.get("max_frames"))
+        done[video_path] = 0
+        memory = estimate_extraction_memory(width, height, options.get("queue_size", 32), options.get("write_threads"),
+                                            options.get("roi"), options.get("max_side"), options.get("size"))
+        plans.append((video_path, memory, end))
+
+    budget = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+    throttle = Throttle(update_interval)
+
+    def report_aggregate():
+        if progress_callback:
+            progress_callback(sum(done.values()), sum(totals.values()))
+
+    def handle(message):
+        kind, video_path, *payload = message
+        if kind == "progress":
+            done[video_path], totals[video_path] = payload
+            if video_progress_callback:
+                video_progress_callback(video_path, *payload)
+            if throttle.ready():
+                report_aggregate()
+        elif log_callback:
+            log_callback(payload[0])
+
+    context = spawn_context()
+    # The children get their own token, backed by process-shared events mirroring token
+    child_token = JobToken(context.Event(), context.Event()) if token is not None else None
+    with context.Manager() as manager, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context,
+                                                   initializer=_init_video_worker,
+                                                   initargs=(child_token,)) as executor:
+        messages = manager.Queue()
+        running = {}  # future -> (video_path, estimated memory, end frame)
+        memory_in_use = 0
+        while plans or running:
+            if token is not None:
+                if token.cancelled:
+                    child_token.cancel()
+                    plans.clear()  # Start nothing new, wait for the running videos to stop
+                elif token.paused and not child_token.paused:
+                    child_token.pause()
+                elif not token.paused and child_token.paused:
+                    child_token.resume()
+
+            # Start as many videos as the decoder and memory caps allow
+            while plans and len(running) < workers and (token is None or not token.paused) and (
+                    budget is None or not running or memory_in_use + plans[0][1] <= budget):
+                video_path, memory, end = plans.popleft()
+                future = executor.submit(_extract_video_task, video_path, output_folder,
+                                         frame_start, frame_end, options, messages, stats.enabled)
+                running[future] = (video_path, memory, end)
+                memory_in_use += memory
+
+            if stats.enabled:
+                stats.sample_queue("messages", messages.qsize())  # A round trip to the manager, only when measuring
+            try:
+                handle(messages.get(timeout=0.1))
+            except queue.Empty:
+                pass
+
+            for future in [future for future in running if future.done()]:
+                video_path, memory, end = running.pop(future)
+                memory_in_use -= memory
+                # Progress messages are queued before the task returns, drain them first
+                while True:
+                    try:
+                        handle(messages.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    results[video_path], video_output_folder, snapshot = future.result()
+                    stats.merge(snapshot)
+                    if resume:
+                        manifests[end].record(video_path, source_stats[video_path],
+                                              [os.path.basename(video_output_folder)], written=results[video_path])
+                except Cancelled:
+                    results[video_path] = 0
+                except Exception as e:
+                    results[video_path] = 0
+                    if log_callback:
+                        log_callback(f"Failed to extract {video_path}: {e}")
+                done[video_path] = totals[video_path]
+                if video_progress_callback:
+                    video_progress_callback(video_path, done[video_path], totals[video_path])
+                report_aggregate()
+
+    for manifest in manifests.values():
+        manifest.close()
+    check(token)
+    return results
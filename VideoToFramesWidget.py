@@ -1,8 +1,16 @@
 import sys
 import os
-import cv2
 from PySide6 import QtWidgets, QtCore, QtGui
 from pathlib import Path
+from VideoToFramesCore import INTERPOLATIONS, create_folder, list_videos, probe_video
+from VideoDecoding import VideoDecoding, available_backends
+from DecoderProbeWorker import DecoderProbeWorker
+from VideoPreviewWorker import VideoPreviewWorker
+from VideoToFramesWorker import VideoToFramesWorker
+from JobControlWidget import JobControlWidget
+from Instrumentation import finish_stats
+from LogSink import LogSink
+from EncodingOptionsWidget import EncodingOptionsWidget
 
 class VideoToFramesWidget(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
@@ -14,7 +22,10 @@ class VideoToFramesWidget(QtWidgets.QWidget):
         self.frame_start = 0
         self.frame_end = 0
         self.fps = 1  # Default fps (to be updated when the video is loaded)
-        self.video_capture = None  # To store the video capture object
+        self.preview_worker = None  # Background thread decoding slider previews
+        self.probe_worker = None  # Background thread timing decoder settings
+        self.preview_frame = 0  # Latest frame requested for the preview
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.stop_preview)
 
         main_layout = QtWidgets.QVBoxLayout()
         self.setLayout(main_layout)
@@ -176,6 +187,125 @@ class VideoToFramesWidget(QtWidgets.QWidget):
         self.slider_label.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
         main_layout.addWidget(self.slider_label)
 
+        # Sampling options: which frames of the selected range to keep
+        sampling_layout = QtWidgets.QHBoxLayout()
+        sampling_label = QtWidgets.QLabel("Sampling:")
+        sampling_label.setStyleSheet("font-size: 16px;")
+        self.sampling_mode = QtWidgets.QComboBox(self)
+        self.sampling_mode.addItems(["Every frame", "Every Nth frame", "Frames per second", "Seconds between frames"])
+        self.sampling_mode.currentIndexChanged.connect(self.update_sampling_inputs)
+        self.sampling_value = QtWidgets.QDoubleSpinBox(self)
+        self.sampling_value.setRange(0.01, 10000)
+        self.sampling_value.setValue(1)
+        self.sampling_value.setEnabled(False)
+        max_frames_label = QtWidgets.QLabel("Max frames:")
+        max_frames_label.setStyleSheet("font-size: 16px;")
+        self.max_frames_input = QtWidgets.QSpinBox(self)
+        self.max_frames_input.setRange(0, 10**8)
+        self.max_frames_input.setSpecialValueText("No limit")  # 0 means no cap
+        sampling_layout.addWidget(sampling_label)
+        sampling_layout.addWidget(self.sampling_mode)
+        sampling_layout.addWidget(self.sampling_value)
+        sampling_layout.addWidget(max_frames_label)
+        sampling_layout.addWidget(self.max_frames_input)
+        main_layout.addLayout(sampling_layout)
+
+        # Near-duplicate suppression for static footage
+        dedup_layout = QtWidgets.QHBoxLayout()
+        self.dedup_checkbox = QtWidgets.QCheckBox("Skip near-duplicate frames", self)
+        self.dedup_checkbox.setStyleSheet("font-size: 16px;")
+        dedup_threshold_label = QtWidgets.QLabel("Minimum change (%):")
+        dedup_threshold_label.setStyleSheet("font-size: 16px;")
+        self.dedup_threshold_input = QtWidgets.QDoubleSpinBox(self)
+        self.dedup_threshold_input.setRange(0.1, 100)
+        self.dedup_threshold_input.setValue(2.0)
+        self.dedup_threshold_input.setEnabled(False)
+        self.dedup_checkbox.toggled.connect(self.dedup_threshold_input.setEnabled)
+        dedup_layout.addWidget(self.dedup_checkbox)
+        dedup_layout.addWidget(dedup_threshold_label)
+        dedup_layout.addWidget(self.dedup_threshold_input)
+        main_layout.addLayout(dedup_layout)
+
+        # Concurrent extraction when a folder of videos is selected
+        parallel_layout = QtWidgets.QHBoxLayout()
+        video_workers_label = QtWidgets.QLabel("Parallel videos:")
+        video_workers_label.setStyleSheet("font-size: 16px;")
+        self.video_workers_input = QtWidgets.QSpinBox(self)
+        self.video_workers_input.setRange(1, max(8, os.cpu_count() or 1))
+        self.video_workers_input.setValue(1)
+        max_memory_label = QtWidgets.QLabel("Memory limit (MB):")
+        max_memory_label.setStyleSheet("font-size: 16px;")
+        self.max_memory_input = QtWidgets.QSpinBox(self)
+        self.max_memory_input.setRange(0, 1024 * 1024)
+        self.max_memory_input.setSingleStep(256)
+        self.max_memory_input.setSpecialValueText("No limit")  # 0 means no cap
+        parallel_layout.addWidget(video_workers_label)
+        parallel_layout.addWidget(self.video_workers_input)
+        parallel_layout.addWidget(max_memory_label)
+        parallel_layout.addWidget(self.max_memory_input)
+        main_layout.addLayout(parallel_layout)
+
+        # Crop and shrink frames before they are encoded
+        resize_layout = QtWidgets.QHBoxLayout()
+        roi_label = QtWidgets.QLabel("Crop (x, y, w, h):")
+        roi_label.setStyleSheet("font-size: 16px;")
+        self.roi_input = QtWidgets.QLineEdit(self)
+        self.roi_input.setPlaceholderText("Full frame")
+        self.roi_input.setValidator(QtGui.QRegularExpressionValidator(
+            QtCore.QRegularExpression(r"\d+\s*,\s*\d+\s*,\s*\d+\s*,\s*\d+"), self))
+        max_side_label = QtWidgets.QLabel("Max side:")
+        max_side_label.setStyleSheet("font-size: 16px;")
+        self.max_side_input = QtWidgets.QSpinBox(self)
+        self.max_side_input.setRange(0, 16384)
+        self.max_side_input.setSingleStep(32)
+        self.max_side_input.setSpecialValueText("Full size")  # 0 keeps the frame size
+        interpolation_label = QtWidgets.QLabel("Filter:")
+        interpolation_label.setStyleSheet("font-size: 16px;")
+        self.interpolation_input = QtWidgets.QComboBox(self)
+        self.interpolation_input.addItems(list(INTERPOLATIONS))
+        resize_layout.addWidget(roi_label)
+        resize_layout.addWidget(self.roi_input)
+        resize_layout.addWidget(max_side_label)
+        resize_layout.addWidget(self.max_side_input)
+        resize_layout.addWidget(interpolation_label)
+        resize_layout.addWidget(self.interpolation_input)
+        main_layout.addLayout(resize_layout)
+
+        # How videos are decoded: backend, decoder threads and hardware acceleration
+        decoder_layout = QtWidgets.QHBoxLayout()
+        decoder_label = QtWidgets.QLabel("Decoder:")
+        decoder_label.setStyleSheet("font-size: 16px;")
+        self.decoder_input = QtWidgets.QComboBox(self)
+        for backend in available_backends():
+            self.decoder_input.addItem({"auto": "Auto", "ffmpeg": "FFmpeg", "gstreamer": "GStreamer"}[backend], backend)
+        decoder_threads_label = QtWidgets.QLabel("Decoder threads:")
+        decoder_threads_label.setStyleSheet("font-size: 16px;")
+        self.decoder_threads_input = QtWidgets.QSpinBox(self)
+        self.decoder_threads_input.setRange(0, 64)
+        self.decoder_threads_input.setSpecialValueText("Default")  # 0 leaves it to the decoder
+        self.hw_decode_checkbox = QtWidgets.QCheckBox("Hardware decoding", self)
+        self.hw_decode_checkbox.setStyleSheet("font-size: 16px;")
+        self.hw_decode_checkbox.setToolTip("Use a GPU decoder where one is available, the CPU otherwise")
+        self.probe_button = QtWidgets.QPushButton("Find fastest", self)
+        self.probe_button.setToolTip("Time every decoder setting on the selected video and pick the fastest")
+        self.probe_button.clicked.connect(self.probe_decoders)
+        decoder_layout.addWidget(decoder_label)
+        decoder_layout.addWidget(self.decoder_input)
+        decoder_layout.addWidget(decoder_threads_label)
+        decoder_layout.addWidget(self.decoder_threads_input)
+        decoder_layout.addWidget(self.hw_decode_checkbox)
+        decoder_layout.addWidget(self.probe_button)
+        main_layout.addLayout(decoder_layout)
+
+        # Format and encoder settings of the written frames
+        self.encoding_options = EncodingOptionsWidget("JPEG", "font-size: 16px;", self)
+        main_layout.addWidget(self.encoding_options)
+
+        # Skip videos a previous (possibly interrupted) run already extracted
+        self.resume_checkbox = QtWidgets.QCheckBox("Skip videos already extracted with these settings", self)
+        self.resume_checkbox.setStyleSheet("font-size: 16px;")
+        main_layout.addWidget(self.resume_checkbox)
+
         # Video to Frame button (disabled initially)
         self.sort_button = QtWidgets.QPushButton('Video to Frame')
         self.sort_button.setEnabled(False)
@@ -197,15 +327,26 @@ class VideoToFramesWidget(QtWidgets.QWidget):
         self.sort_button.clicked.connect(self.process_all_videos_in_directory)
         main_layout.addWidget(self.sort_button)
 
+        # Pause / Cancel for the running extraction
+        self.job_controls = JobControlWidget(self)
+        main_layout.addWidget(self.job_controls)
+
         # Progress bar
         self.progress_bar = QtWidgets.QProgressBar(self)
         self.progress_bar.setValue(0)
         main_layout.addWidget(self.progress_bar)
+        # Per-video progress while several videos are extracted at once
+        self.video_status_label = QtWidgets.QLabel("")
+        self.video_status_label.setStyleSheet("font-size: 14px;")
+        self.video_status_label.setWordWrap(True)
+        main_layout.addWidget(self.video_status_label)
+        self.video_progress = {}
         # Output log for progress display
         self.log_output = QtWidgets.QTextEdit()
         self.log_output.setReadOnly(True)
         self.log_output.setStyleSheet("font-size: 14px;")
         main_layout.addWidget(self.log_output)
+        self.log_sink = LogSink(self.log_output, self.update_progress_bar, parent=self)
 
     def open_file_dialog(self):
         dialog = QtWidgets.QFileDialog(self)
@@ -220,12 +361,14 @@ class VideoToFramesWidget(QtWidgets.QWidget):
             self.check_both_buttons_clicked()
 
     def load_video_frames(self, video_path):
-        if(self.video_capture):
-            self.video_capture.release()
-        self.video_capture = cv2.VideoCapture(video_path)
-        
-        self.total_frames = int(self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.video_capture.get(cv2.CAP_PROP_FPS)  # Get the frames per second
+        self.stop_preview()
+        self.total_frames, self.fps = probe_video(video_path)[:2]  # Get the frame count and frames per second
+
+        # Decode previews on a background thread so dragging the sliders never blocks the GUI
+        self.preview_worker = VideoPreviewWorker(video_path, (self.video_label.width(), self.video_label.height()),
+                                                 self.total_frames, decoding=self.decoding())
+        self.preview_worker.frame_ready.connect(self.display_frame)
+        self.preview_worker.start()
 
         # Set slider maximum to total frames
         self.start_slider.setEnabled(True)
@@ -236,6 +379,39 @@ class VideoToFramesWidget(QtWidgets.QWidget):
         self.update_slider_label()
         self.show_frame(0)  # Show the first frame when the video is loaded
 
+    def decoding(self):
+        """The chosen VideoDecoding, or None for OpenCV's defaults."""
+        decoding = VideoDecoding(self.decoder_input.currentData(), self.decoder_threads_input.value() or None,
+                                 "any" if self.hw_decode_checkbox.isChecked() else "none")
+        return None if decoding.settings() == VideoDecoding().settings() else decoding
+
+    def probe_decoders(self):
+        """Time the decoder settings on the selected video in the background and select the fastest."""
+        videos = list_videos(self.filename.text()) if self.filename.text() else []
+        if not videos:
+            self.log_sink.append("Select a video first to find its fastest decoder settings.")
+            return
+        self.probe_button.setEnabled(False)
+        self.probe_worker = DecoderProbeWorker(videos[0])
+        self.probe_worker.log_signal.connect(self.log_sink.append)
+        self.probe_worker.result_signal.connect(self.apply_decoding)
+        self.probe_worker.finished_signal.connect(lambda: self.probe_button.setEnabled(True))
+        self.probe_worker.start()
+
+    def apply_decoding(self, decoding):
+        if decoding is None:
+            self.log_sink.append("No decoder setting could open the video.")
+            return
+        self.decoder_input.setCurrentIndex(max(0, self.decoder_input.findData(decoding.backend)))
+        self.decoder_threads_input.setValue(decoding.threads or 0)
+        self.hw_decode_checkbox.setChecked(decoding.hw_acceleration != "none")
+        self.log_sink.append(f"Selected the fastest decoder setting: {decoding.describe()}")
+
+    def stop_preview(self):
+        if self.preview_worker is not None:
+            self.preview_worker.stop()
+            self.preview_worker = None
+
     def update_start_slider_value(self, value):
         self.frame_start = value
         if self.frame_start > self.frame_end:
@@ -260,28 +436,22 @@ class VideoToFramesWidget(QtWidgets.QWidget):
 
     def show_frame(self, frame_number):
         """Display a specific frame in the QLabel"""
-        if self.video_capture is None:
+        if self.preview_worker is None:
             return
+        self.preview_frame = frame_number
+        self.preview_worker.request_frame(frame_number)
 
-        # Set the video capture to the desired frame
-        self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-        success, frame = self.video_capture.read()
-
-        if success:
-            # Convert the frame to RGB (since OpenCV uses BGR)
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # Convert the frame to a QImage to display in the QLabel
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            q_img = QtGui.QImage(frame_rgb.data, w, h, bytes_per_line, QtGui.QImage.Format_RGB888)
+    def display_frame(self, frame_number, q_img):
+        # Drop previews of frames the sliders have already moved past
+        if frame_number != min(self.preview_frame, self.total_frames - 1):
+            return
 
-            # Scale the image to fit the QLabel size
-            pixmap = QtGui.QPixmap.fromImage(q_img)
-            pixmap = pixmap.scaled(self.video_label.size(), QtCore.Qt.KeepAspectRatio)
+        # Scale the image to fit the QLabel size
+        pixmap = QtGui.QPixmap.fromImage(q_img)
+        pixmap = pixmap.scaled(self.video_label.size(), QtCore.Qt.KeepAspectRatio)
 
-            # Update the QLabel with the pixmap
-            self.video_label.setPixmap(pixmap)
+        # Update the QLabel with the pixmap
+        self.video_label.setPixmap(pixmap)
 
     def open_video_dialog(self):
         folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Select a Folder to save images", "C:")
@@ -296,76 +466,92 @@ class VideoToFramesWidget(QtWidgets.QWidget):
             self.sort_button.setEnabled(True)
 
     def create_folder(self, folder_name):
-        if not os.path.exists(folder_name):
-            os.makedirs(folder_name)
-
-    def process_video(self, video_path, output_folder):
-        video_name = os.path.splitext(os.path.basename(video_path))[0]
-        # Convert frame start and end to seconds
-        start_seconds = int(self.frame_start // self.fps)
-        
-        end_seconds = int(self.frame_end // self.fps)
-
-        # Create a subfolder using the video name and the start/end times
-        subfolder_name = f"{video_name}_{start_seconds}s-{end_seconds}s"
-        video_output_folder = os.path.join(output_folder, subfolder_name)
-        self.create_folder(video_output_folder)
-
-        self.video_capture = cv2.VideoCapture(video_path)
-    
-        # Move the video capture to the start frame
-        self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, self.frame_start)
-        total_frames = self.frame_end  # Use self.frame_end instead of total_frames
-        self.log_output.append(f"Processing video: {video_name} (up to frame {total_frames})")
-
-        # Set the progress bar range
-        self.progress_bar.setMaximum(total_frames - self.frame_start)
-        self.progress_bar.setValue(0)  # Reset the progress bar
-        QtCore.QCoreApplication.processEvents()  # Update UI
-
-
-        if(self.frame_start!=0):
-            print_count = 0
-        else:
-            print_count = count
-        print_total_frames = self.frame_end - self.frame_start
-        count = self.frame_start
-        print(count)
-        while count < total_frames:
-            success, image = self.video_capture.read()
-            if not success:
-                break
-            if count >= self.frame_start:
-                frame_filename = f"{video_name}_frame{count}.jpg"
-                cv2.imwrite(os.path.join(video_output_folder, frame_filename), image)
-                self.log_output.append(f"Extracting frame {print_count}/{print_total_frames}")
-                self.progress_bar.setValue(count - self.frame_start + 1)
-            count += 1
-            print_count+=1
-            QtCore.QCoreApplication.processEvents()  # Ensure real-time updates
-
-        # self.video_capture.release()
-        self.log_output.append(f"\n{self.frame_end-self.frame_start} images are extracted in {video_output_folder}.")
-        QtCore.QCoreApplication.processEvents()  # Update UI
-        self.show_frame(self.frame_start)
-        self.reset_state()
+        create_folder(folder_name)
 
     def process_all_videos_in_directory(self):
+        """Start frame extraction in a separate thread."""
         output_folder = self.foldername.text()
         self.create_folder(output_folder)
         directory_path = self.filename.text()
-        self.log_output.clear()  # Clear previous log output
-
-        if directory_path.endswith((".mp4", ".avi", ".mov")):
-            video_path = directory_path
-            self.process_video(video_path, output_folder)
-        else:
-            for filename in os.listdir(directory_path):
-                if filename.endswith((".mp4", ".avi", ".mov")):
-                    video_path = os.path.join(directory_path, filename)
-                    self.process_video(video_path, output_folder)
-        
-        self.log_output.append("Finish extracting video to frames.")
+        self.log_sink.clear()  # Clear previous log output
+        self.progress_bar.setValue(0)  # Reset the progress bar
+
+        # Create and start the worker thread
+        self.video_progress = {}
+        self.video_status_label.setText("")
+        self.worker = VideoToFramesWorker(directory_path, output_folder, self.frame_start, self.frame_end,
+                                          self.get_extraction_options(),
+                                          video_workers=self.video_workers_input.value(),
+                                          max_memory_mb=self.max_memory_input.value() or None)
+
+        # Connect signals to update the log and handle completion
+        self.worker.log_signal.connect(self.log_sink.append)
+        self.worker.progress_signal.connect(self.log_sink.progress)
+        self.worker.video_progress_signal.connect(self.update_video_progress)
+        self.worker.finished_signal.connect(self.extraction_finished)
+
+        # Keep the button disabled while the worker is running
+        self.sort_button.setEnabled(False)
+        self.job_controls.set_token(self.worker.token)
+        self.log_sink.start("extract", self.worker.stats)
+        self.worker.start()
+
+    def update_sampling_inputs(self, index):
+        """Only ask for a sampling value when a sampling mode other than every frame is chosen."""
+        self.sampling_value.setEnabled(index != 0)
+        self.sampling_value.setDecimals(0 if index == 1 else 2)
+        self.sampling_value.setMinimum(1 if index == 1 else 0.01)
+
+    def get_extraction_options(self):
+        """Get the extract_frames keyword arguments for the current sampling settings."""
+        options = {}
+        mode = self.sampling_mode.currentIndex()
+        if mode == 1:
+            options["stride"] = int(self.sampling_value.value())
+        elif mode == 2:
+            options["target_fps"] = self.sampling_value.value()
+        elif mode == 3:
+            options["interval"] = self.sampling_value.value()
+        if self.max_frames_input.value():
+            options["max_frames"] = self.max_frames_input.value()
+        if self.dedup_checkbox.isChecked():
+            options["dedup_threshold"] = self.dedup_threshold_input.value()
+        if self.roi_input.hasAcceptableInput():
+            options["roi"] = tuple(int(value) for value in self.roi_input.text().split(","))
+        if self.max_side_input.value():
+            options["max_side"] = self.max_side_input.value()
+        if "roi" in options or "max_side" in options:
+            options["interpolation"] = self.interpolation_input.currentText()
+        if self.decoding() is not None:
+            options["decoding"] = self.decoding()
+        if self.resume_checkbox.isChecked():
+            options["resume"] = True
+        if self.encoding_options.encoding() is not None:
+            options["encoding"] = self.encoding_options.encoding()
+        if self.encoding_options.shards() is not None:
+            options["shards"] = self.encoding_options.shards()
+        return options
+
+    def update_progress_bar(self, value, maximum):
+        """Update the progress bar with the given value."""
+        self.progress_bar.setMaximum(max(1, maximum))
+        self.progress_bar.setValue(value)
+
+    def update_video_progress(self, video_path, value, maximum):
+        """Show the progress of every video that has started, finished ones included."""
+        self.video_progress[os.path.basename(video_path)] = 100 * value // max(1, maximum)
+        self.video_status_label.setText("  ".join(f"{name}: {percent}%" for name, percent in self.video_progress.items()))
+
+    def extraction_finished(self):
+        if not self.worker.token.cancelled:
+            self.log_sink.append("Finish extracting video to frames.")
+        self.log_sink.flush()  # Counted in the stats summary
+        finish_stats(self.worker.stats, self.log_sink.append)
+        self.log_sink.finish()
+        self.job_controls.set_token(None)
+        self.show_frame(self.frame_start)
+        self.reset_state()
+        self.check_both_buttons_clicked()
 
     def reset_state(self):
         # self.show_frame(self.frame_start)
@@ -373,7 +559,7 @@ class VideoToFramesWidget(QtWidgets.QWidget):
         self.progress_bar.setValue(0)
         
         # Update the log output to indicate readiness for further frame extraction.
-        self.log_output.append("\nProcessing complete. You can adjust the sliders to extract another range of frames.")
+        self.log_sink.append("\nProcessing complete. You can adjust the sliders to extract another range of frames.")
 
         # Disable the "Video to Frame" button until the user adjusts the sliders again.
         # self.sort_button.setEnabled(False)
\ No newline at end of file
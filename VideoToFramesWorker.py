@@ -0,0 +1,59 @@
+import os
+from PySide6.QtCore import QThread, Signal
+from VideoToFramesCore import extract_frames, extract_videos, list_videos
+from JobControl import Cancelled, JobToken
+from Instrumentation import PROFILE_ENV, profiled, stats_from_env
+
+class VideoToFramesWorker(QThread):
+    log_signal = Signal(str)  # Signal to emit log messages
+    finished_signal = Signal()  # Signal to emit when the process is finished
+    progress_signal = Signal(int, int)  # Signal to emit (frames done, frames total) across the whole job
+    video_progress_signal = Signal(str, int, int)  # Signal to emit (video path, frames done, frames total)
+
+    def __init__(self, video_path, output_folder, frame_start, frame_end, options=None,
+                 video_workers=1, max_memory_mb=None):
+        super().__init__()
+        self.video_path = video_path  # A single video or a folder of videos
+        self.output_folder = output_folder
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.options = options or {}  # Extra keyword arguments for extract_frames
+        self.video_workers = video_workers  # Videos extracted at once, each in its own process
+        self.max_memory_mb = max_memory_mb  # Memory budget shared by the concurrent extractions
+        self.token = JobToken()  # Pauses or cancels the extraction between frames
+        self.stats = stats_from_env("extract")
+
+    def run(self):
+        with profiled(os.environ.get(PROFILE_ENV)):
+            self.extract()
+
+        # Emit finished signal when done
+        self.finished_signal.emit()
+
+    def extract(self):
+        """Extract every selected video, one after the other or in a pool of processes."""
+        video_paths = list_videos(self.video_path)
+        if self.video_workers > 1 and len(video_paths) > 1:
+            try:
+                extract_videos(video_paths, self.output_folder, self.frame_start, self.frame_end,
+                               workers=self.video_workers, max_memory_mb=self.max_memory_mb,
+                               progress_callback=self.progress_signal.emit,
+                               video_progress_callback=self.video_progress_signal.emit,
+                               log_callback=self.log_signal.emit,
+                               token=self.token, stats=self.stats, **self.options)
+            except Cancelled:
+                self.log_signal.emit("Extraction cancelled.")
+            except Exception as e:
+                self.log_signal.emit(f"Failed to extract videos: {e}")
+        else:
+            for video_path in video_paths:
+                try:
+                    extract_frames(video_path, self.output_folder, self.frame_start, self.frame_end,
+                                   progress_callback=self.progress_signal.emit,
+                                   log_callback=self.log_signal.emit,
+                                   token=self.token, stats=self.stats, **self.options)
+                except Cancelled:
+                    self.log_signal.emit("Extraction cancelled.")
+                    break
+                except Exception as e:
+                    self.log_signal.emit(f"Failed to extract {video_path}: {e}")
@@ -0,0 +1,327 @@
+"""Benchmarks for the headless processing cores, on synthetic data.
+
+    python benchmark.py                          # default scale, results in <data>/benchmark-results.json
+    python benchmark.py --scale small --only augment
+    python benchmark.py --output new.json --compare old.json
+
+Synthetic image folders, videos (written with cv2.VideoWriter) and _annotations.csv
+datasets are generated once into --data and reused by later runs. Every case runs in its
+own process so its peak RSS is its own, and is repeated --repeat times; the median wall
+time gives the throughput. Results are written as JSON together with the machine, library
+versions and git commit, and --compare prints the change against an earlier results file,
+exiting with status 1 if any case got slower by more than --threshold percent.
+Like cvhelper.py this never imports PySide6.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows, peak RSS is then left out
+
+# name -> image folders as (width, height, count), videos as (width, height, frames), annotated images per split
+SCALES = {
+    "small": {"images": [(256, 256, 200), (1280, 720, 40)], "videos": [(640, 360, 150)], "annotations": 5_000},
+    "default": {"images": [(224, 224, 1000), (640, 480, 400), (1920, 1080, 60)],
+                "videos": [(640, 360, 600), (1280, 720, 300)], "annotations": 50_000},
+    "large": {"images": [(224, 224, 5000), (640, 480, 2000), (1920, 1080, 300), (3840, 2160, 40)],
+              "videos": [(640, 360, 1800), (1920, 1080, 600)], "annotations": 500_000},
+}
+SEED = 1234
+AUGMENT_PARAMS = (30, "Yes", "No", 0.2, 10, 0.5)  # rotation, flip_lr, flip_tb, zoom, shear, probability
+DONE_MARKER = ".benchmark_done"
+
+
+def synthetic_image(rng, width, height):
+    """A smooth gradient with a few shapes and some noise, so it compresses like a photo rather than like noise."""
+    import cv2
+    import numpy as np
+
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    phase = rng.random(3) * 6.28
+    img = np.empty((height, width, 3), np.float32)
+    for channel in range(3):
+        img[..., channel] = 127 + 100 * np.sin(3 * x + 2 * y + phase[channel])
+    img = img.astype(np.uint8)
+    for _ in range(8):
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        radius = int(rng.integers(4, max(5, min(width, height) // 4)))
+        cv2.circle(img, center, radius, tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+    noise = rng.integers(-8, 9, img.shape, dtype=np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def _generate(path, build):
+    """Run build(path) unless an earlier run already finished generating path."""
+    if os.path.exists(os.path.join(path, DONE_MARKER)):
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    build(path)
+    open(os.path.join(path, DONE_MARKER), "w").close()
+
+
+def generate_images(path, width, height, count):
+    import cv2
+    import numpy as np
+
+    def build(path):
+        rng = np.random.default_rng(SEED)
+        for index in range(count):
+            cv2.imwrite(os.path.join(path, f"{index:06d}.jpg"), synthetic_image(rng, width, height))
+    _generate(path, build)
+
+
+def generate_video(path, width, height, frames, fps=30):
+    """A background image panned a few pixels per frame with a moving square, as MPEG-4 in an .mp4."""
+    import cv2
+    import numpy as np
+
+    def build(folder):
+        rng = np.random.default_rng(SEED)
+        background = synthetic_image(rng, width + frames, height)
+        writer = cv2.VideoWriter(os.path.join(folder, "video.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                                 (width, height))
+        try:
+            for index in range(frames):
+                frame = np.ascontiguousarray(background[:, index:index + width])
+                corner = (index * 7 % max(1, width - 40), index * 3 % max(1, height - 40))
+                cv2.rectangle(frame, corner, (corner[0] + 40, corner[1] + 40), (255, 255, 255), -1)
+                writer.write(frame)
+        finally:
+            writer.release()
+    _generate(path, build)
+    return os.path.join(path, "video.mp4")
+
+
+def generate_annotations(path, count, classes=7):
+    """train/ and test/ folders of count empty images each, with two boxes per image in _annotations.csv."""
+    import pandas as pd
+
+    def build(path):
+        for split in ("train", "test"):
+            folder = os.path.join(path, split)
+            os.makedirs(folder)
+            filenames = [f"{index:07d}.jpg" for index in range(count)]
+            for filename in filenames:
+                open(os.path.join(folder, filename), "wb").close()
+            rows = [(filename, 640, 640, index % classes, 10, 10, 100, 100)
+                    for index, filename in enumerate(filenames) for _ in range(2)]
+            pd.DataFrame(rows, columns=["filename", "width", "height", "class", "xmin", "ymin", "xmax", "ymax"]) \
+                .to_csv(os.path.join(folder, "_annotations.csv"), index=False)
+    _generate(path, build)
+
+
+def build_cases(scale, data_dir, workers):
+    """name -> (generate, run). generate() prepares the input, run(output_dir, stats) returns (items, unit)."""
+    spec = SCALES[scale]
+    cases = {}
+
+    for width, height, count in spec["images"]:
+        folder = os.path.join(data_dir, f"images-{width}x{height}-{count}")
+
+        def augment(output_dir, stats, folder=folder, workers=1):
+            from AugmentationCore import augment_folder
+            images = sum(1 for _ in augment_folder(folder, output_dir, AUGMENT_PARAMS, workers=workers, seed=SEED,
+                                                    stats=stats))
+            return images, "images"
+
+        generate = lambda folder=folder, size=(width, height, count): generate_images(folder, *size)
+        cases[f"augment/{width}x{height}"] = (generate, augment)
+        if workers > 1:
+            cases[f"augment/{width}x{height}/workers{workers}"] = (
+                generate, lambda output_dir, stats, augment=augment: augment(output_dir, stats, workers=workers))
+
+    for width, height, frames in spec["videos"]:
+        folder = os.path.join(data_dir, f"video-{width}x{height}-{frames}")
+
+        def extract(output_dir, stats, folder=folder, **options):
+            from VideoToFramesCore import extract_frames
+            written, _ = extract_frames(os.path.join(folder, "video.mp4"), output_dir, stats=stats, **options)
+            return written, "frames"
+
+        generate = lambda folder=folder, size=(width, height, frames): generate_video(folder, *size)
+        cases[f"extract/{width}x{height}"] = (generate, extract)
+        cases[f"extract/{width}x{height}/stride10"] = (
+            generate, lambda output_dir, stats, extract=extract: extract(output_dir, stats, stride=10))
+
+    folder = os.path.join(data_dir, f"annotations-{spec['annotations']}")
+    for mode in ("hardlink", "manifest"):
+        def sort(output_dir, stats, mode=mode):
+            from SortImageCore import sort_images_by_class
+            sort_images_by_class(folder, log_callback=lambda message: None, mode=mode,
+                                 output_path=output_dir, stats=stats)
+            return stats.counters.get("files", 0), "files"
+
+        cases[f"sort/{mode}"] = (lambda: generate_annotations(folder, spec["annotations"]), sort)
+    return cases
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children (pool workers), in MB."""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # macOS reports bytes, Linux kilobytes
+    usage = [resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale]
+    try:
+        # Linux keeps ru_maxrss across exec, so it would report the benchmark parent's peak.
+        # VmHWM starts afresh with this process.
+        with open("/proc/self/status") as status:
+            usage[0] = next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        pass
+    return round(max(usage) / 1e6, 1)
+
+
+def run_case(args):
+    """Child process entry point: run one case once and print its result as JSON."""
+    from Instrumentation import RunStats
+
+    _, run = build_cases(args.scale, args.data, args.workers)[args.run_case]
+    # Inside the data folder, so hard links and renames never cross filesystems
+    output_dir = tempfile.mkdtemp(prefix="output-", dir=args.data)
+    try:
+        stats = RunStats(args.run_case)
+        start = time.perf_counter()
+        items, unit = run(output_dir, stats)
+        seconds = time.perf_counter() - start
+        stats.stop()
+        report = stats.report()
+        result = {"seconds": seconds, "items": items, "unit": unit,
+                  "bytes": report["counters"].get("bytes_written", 0),
+                  "peak_rss_mb": peak_rss_mb(), "stages": report["stages"], "queues": report["queues"]}
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def benchmark(name, args):
+    """Run a case args.repeat times in fresh processes and summarise the runs."""
+    runs = []
+    for _ in range(args.repeat):
+        command = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--scale", args.scale,
+                   "--data", args.data, "--workers", str(args.workers)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    seconds = statistics.median(run["seconds"] for run in runs)
+    fastest = min(runs, key=lambda run: run["seconds"])
+    rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    return {"unit": fastest["unit"], "items": fastest["items"],
+            "seconds_median": round(seconds, 4), "seconds_min": round(fastest["seconds"], 4),
+            "items_per_s": round(fastest["items"] / seconds, 2) if seconds else None,
+            "mb_per_s": round(fastest["bytes"] / 1e6 / seconds, 2) if seconds and fastest["bytes"] else None,
+            "peak_rss_mb": max(rss) if rss else None,
+            "stages": fastest["stages"], "queues": fastest["queues"]}
+
+
+def environment():
+    import cv2
+    import numpy as np
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """Print the throughput change of every case also in baseline. Returns the names that regressed."""
+    regressions = []
+    print(f"\n{'case':<34}{'before':>12}{'after':>12}{'change':>9}")
+    for name, result in results["cases"].items():
+        before = baseline.get("cases", {}).get(name, {}).get("items_per_s")
+        after = result.get("items_per_s")
+        if not before or not after:
+            continue
+        change = 100 * (after - before) / before
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  slower"
+        print(f"{name:<34}{before:>12.1f}{after:>12.1f}{change:>+8.1f}%{flag}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the CVHelper processing cores.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="default", help="Size of the synthetic data")
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "cvhelper-benchmark"),
+                        help="Where synthetic data is generated and kept between runs")
+    parser.add_argument("--only", action="append",
+                        help="Only run cases whose name starts with this (e.g. augment, extract/640x360), repeatable")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the median is reported")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Also benchmark augmentation with this many processes (1 to skip)")
+    parser.add_argument("--output", help="JSON file the results are written to (default: benchmark-results.json "
+                                         "in --data)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Throughput drop, in percent, that counts as a regression in --compare")
+    parser.add_argument("--run-case", dest="run_case", help=argparse.SUPPRESS)  # Used for the per-case processes
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_case:
+        run_case(args)
+        return 0
+
+    cases = build_cases(args.scale, args.data, args.workers)
+    names = [name for name in cases if not args.only or name.startswith(tuple(args.only))]
+    if not names:
+        raise SystemExit(f"No benchmark matches {', '.join(args.only)}")
+
+    print(f"Preparing synthetic data in {args.data}", flush=True)
+    for name in names:
+        cases[name][0]()
+
+    results = {"scale": args.scale, "repeat": args.repeat, "environment": environment(), "cases": {}}
+    print(f"{'case':<34}{'items/s':>10}{'MB/s':>9}{'median s':>10}{'peak MB':>9}")
+    for name in names:
+        result = results["cases"][name] = benchmark(name, args)
+        if "error" in result:
+            print(f"{name:<34} failed: {result['error']}", flush=True)
+            continue
+        mb_per_s = "-" if result["mb_per_s"] is None else f"{result['mb_per_s']:.1f}"
+        peak_rss = "-" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.1f}"
+        print(f"{name:<34}{result['items_per_s']:>10.1f}{mb_per_s:>9}{result['seconds_median']:>10.3f}{peak_rss:>9}",
+              flush=True)
+
+    if args.output is None:
+        os.makedirs(args.data, exist_ok=True)
+        args.output = os.path.join(args.data, "benchmark-results.json")
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} cases are more than {args.threshold:g}% slower: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""Headless command-line entry point for the CVHelper tools.
+
+    python cvhelper.py augment --input images/ --output augmented/ --rotation 30 --flip-lr
+    python cvhelper.py extract --input video.mp4 --output frames/ --start 0 --end 300
+    python cvhelper.py sort --input dataset/
+    python cvhelper.py encode-benchmark --input images/
+    python cvhelper.py decode-benchmark --input video.mp4
+
+Every option can also come from a JSON or YAML file passed with --config, either as a
+flat mapping of options or as one section per command. Command-line flags win over the
+config file. --stats prints per-stage timings and throughput at the end of a run,
+--report writes them as JSON and --profile saves a cProfile dump. This module never
+imports PySide6, and the processing cores are only imported once a command runs.
+"""
+import argparse
+import json
+import os
+import sys
+from ProcessingOptions import (DECODER_BACKEND_CONSTANTS, DEFAULT_SHARD_MB, INTERPOLATION_CONSTANTS, OUTPUT_FORMATS,
+                               SHARD_FORMATS, SORT_MODES)
+
+ENCODING_OPTIONS = {
+    "format": None,
+    "quality": None,
+    "png_compression": None,
+    "jpeg_optimize": False,
+    "jpeg_progressive": False,
+}
+SHARD_OPTIONS = {
+    "shards": None,
+    "shard_mb": DEFAULT_SHARD_MB,
+    "shard_size": None,
+}
+
+DEFAULTS = {
+    "augment": {
+        "rotation": 0,
+        "flip_lr": False,
+        "flip_tb": False,
+        "zoom": 0.0,
+        "shear": 0,
+        "probability": 0.5,
+        "workers": 1,
+        "seed": None,
+        "variants": 1,
+        "extensions": None,
+        "recursive": False,
+        "index_cache": False,
+        "resume": False,
+        "io_threads": 4,
+        **ENCODING_OPTIONS,
+        **SHARD_OPTIONS,
+    },
+    "extract": {
+        "start": 0,
+        "end": None,
+        "write_threads": None,
+        "stride": 1,
+        "target_fps": None,
+        "interval": None,
+        "max_frames": None,
+        "dedup_threshold": None,
+        "video_workers": 1,
+        "max_memory_mb": None,
+        "roi": None,
+        "max_side": None,
+        "size": None,
+        "interpolation": "area",
+        "decoder": "auto",
+        "decoder_threads": None,
+        "hw_decode": False,
+        "resume": False,
+        **ENCODING_OPTIONS,
+        **SHARD_OPTIONS,
+    },
+    "sort": {
+        "move_threads": 4,
+        "mode": "move",
+        "output": None,
+        **SHARD_OPTIONS,
+    },
+    "encode-benchmark": {
+        "sample": 20,
+        "output": None,
+        **ENCODING_OPTIONS,
+    },
+    "decode-benchmark": {
+        "frames": 100,
+        "output": None,
+    },
+}
+
+
+def load_config(path, command):
+    """Load the options for command from a JSON or YAML config file."""
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("PyYAML is required for YAML configs (pip install pyyaml)")
+            config = yaml.safe_load(f) or {}
+        else:
+            config = json.load(f)
+    if not isinstance(config, dict):
+        raise SystemExit(f"Config file {path} must contain a mapping of options")
+    # A config may hold one section per command
+    if isinstance(config.get(command), dict):
+        config = config[command]
+    return {key.replace("-", "_"): value for key, value in config.items()}
+
+
+def resolve_options(args):
+    """Merge defaults, config file and command-line flags, in increasing priority."""
+    options = dict(DEFAULTS[args.command])
+    if args.config:
+        options.update(load_config(args.config, args.command))
+    for key, value in vars(args).items():
+        if key not in ("command", "config") and value is not None:
+            options[key] = value
+    input_only = ("sort", "encode-benchmark", "decode-benchmark")
+    for required in ("input",) if args.command in input_only else ("input", "output"):
+        if not options.get(required):
+            raise SystemExit(f"cvhelper {args.command}: --{required} is required (flag or config)")
+    if args.command == "augment" and options.get("resume") and options.get("shards"):
+        raise SystemExit("cvhelper augment: --resume cannot be combined with --shards")
+    return options
+
+
+def log(message, quiet=False):
+    if not quiet:
+        print(message, flush=True)
+
+
+def build_encoding(options):
+    """ImageEncoding for the encoding options, or None when they are all left at their defaults."""
+    if all(options[key] == default for key, default in ENCODING_OPTIONS.items()):
+        return None
+    from ImageEncoding import ImageEncoding
+    return ImageEncoding(options["format"] or "same", options["quality"], options["png_compression"],
+                         bool(options["jpeg_optimize"]), bool(options["jpeg_progressive"]))
+
+
+def parse_numbers(value, separator, count):
+    """count ints from a "1<separator>2" string (or a list from a config file), None if unset."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.lower().split(separator)
+    if len(value) != count:
+        raise ValueError(f"Expected {count} numbers separated by {separator!r}, got {value!r}")
+    return tuple(int(number) for number in value)
+
+
+def build_shards(options, default=None):
+    """ShardFormat for the shard options, or None when no shard format (nor default) is chosen."""
+    if not (options["shards"] or default):
+        return None
+    from ShardWriter import ShardFormat
+    return ShardFormat(options["shards"] or default, float(options["shard_mb"]),
+                       parse_numbers(options["shard_size"], "x", 2))
+
+
+def build_decoding(options, video_path, quiet=False):
+    """VideoDecoding for the decoder options, or None for OpenCV's defaults.
+
+    The "fastest" decoder probes video_path and uses whatever decodes it fastest.
+    """
+    from VideoDecoding import VideoDecoding, fastest_decoding
+    if options["decoder"] == "fastest":
+        decoding = fastest_decoding(video_path)
+        log(f"Fastest decoder settings for {os.path.basename(video_path)}: {decoding.describe()}", quiet)
+        return decoding
+    decoding = VideoDecoding(options["decoder"], options["decoder_threads"],
+                             "any" if options["hw_decode"] else "none")
+    return None if decoding.settings() == VideoDecoding().settings() else decoding
+
+
+def run_augment(options, stats):
+    from AugmentationCore import IMAGE_EXTENSIONS, augment_folder
+
+    yes_no = lambda value: "Yes" if value in (True, "Yes", "yes") else "No"
+    params = (int(options["rotation"]), yes_no(options["flip_lr"]), yes_no(options["flip_tb"]),
+              float(options["zoom"]), int(options["shear"]), float(options["probability"]))
+    os.makedirs(options["output"], exist_ok=True)
+
+    processed_images = 0
+    for image_file, ok in augment_folder(options["input"], options["output"], params,
+                                         workers=int(options["workers"]), seed=options["seed"],
+                                         variants=int(options["variants"]),
+                                         extensions=options["extensions"] or IMAGE_EXTENSIONS,
+                                         recursive=bool(options["recursive"]), cache=bool(options["index_cache"]),
+                                         resume=bool(options["resume"]), stats=stats,
+                                         io_threads=int(options["io_threads"]), encoding=build_encoding(options),
+                                         shards=build_shards(options)):
+        processed_images += 1
+        if ok is None:
+            log(f"Already augmented {image_file}", options["quiet"])
+        else:
+            log(f"Processed {image_file}" if ok else f"Skipped {image_file} (could not be read or written)",
+                options["quiet"])
+    log(f"Augmentation completed for {processed_images} images.", options["quiet"])
+    return 0
+
+
+def run_extract(options, stats):
+    from VideoToFramesCore import create_folder, extract_frames, extract_videos, list_videos
+
+    create_folder(options["output"])
+    videos = list_videos(options["input"])
+    if not videos:
+        log(f"No videos found in {options['input']}")
+        return 1
+    quiet = options["quiet"]
+    frame_start = int(options["start"])
+    frame_end = None if options["end"] is None else int(options["end"])
+    # Every other extract option maps straight onto an extract_frames keyword argument
+    extract_options = {key: options[key] for key in DEFAULTS["extract"]
+                       if key not in ("start", "end", "video_workers", "max_memory_mb", *ENCODING_OPTIONS,
+                                      *SHARD_OPTIONS, "decoder", "decoder_threads", "hw_decode")}
+    extract_options["encoding"] = build_encoding(options)
+    extract_options["shards"] = build_shards(options)
+    extract_options["roi"] = parse_numbers(options["roi"], ",", 4)
+    extract_options["size"] = parse_numbers(options["size"], "x", 2)
+    extract_options["decoding"] = build_decoding(options, videos[0], quiet)
+    video_workers = int(options["video_workers"])
+    if video_workers > 1 and len(videos) > 1:
+        extract_videos(videos, options["output"], frame_start, frame_end,
+                       workers=video_workers, max_memory_mb=options["max_memory_mb"],
+                       log_callback=None if quiet else log,
+                       stats=stats, **extract_options)
+    else:
+        failed = 0
+        for video_path in videos:
+            try:
+                extract_frames(video_path, options["output"], frame_start, frame_end,
+                               log_callback=None if quiet else log,
+                               stats=stats, **extract_options)
+            except OSError as e:
+                log(f"Failed to extract {video_path}: {e}")
+                failed += 1
+        if failed:
+            return 1
+    log("Finish extracting video to frames.", quiet)
+    return 0
+
+
+def run_sort(options, stats):
+    from SortImageCore import sort_images_by_class
+
+    quiet = options["quiet"]
+    mode = "shards" if options["shards"] else options["mode"]  # --shards alone is enough to pack
+    sort_images_by_class(options["input"], log_callback=lambda message: log(message, quiet),
+                         move_threads=int(options["move_threads"]), mode=mode,
+                         output_path=options["output"], stats=stats,
+                         shards=build_shards(options, "tar") if mode == "shards" else None)
+    return 0
+
+
+def run_encode_benchmark(options, stats):
+    """Encode a sample of the input's images or video frames with several encodings and compare them."""
+    import cv2
+    from AugmentationCore import list_images
+    from ImageEncoding import BENCHMARK_ENCODINGS, benchmark_encodings
+    from VideoToFramesCore import VIDEO_EXTENSIONS
+
+    path, sample = options["input"], int(options["sample"])
+    images = []
+    if path.lower().endswith(VIDEO_EXTENSIONS):
+        video_capture = cv2.VideoCapture(path)
+        total_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in range(sample):
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, index * total_frames // sample)
+            success, image = video_capture.read()
+            if success:
+                images.append(image)
+        video_capture.release()
+    else:
+        image_files = sorted(list_images(path))
+        for image_file in image_files[::max(1, len(image_files) // sample)][:sample]:
+            image = cv2.imread(os.path.join(path, image_file))
+            if image is not None:
+                images.append(image)
+    if not images:
+        log(f"No images or video frames found in {path}")
+        return 1
+
+    encodings = list(BENCHMARK_ENCODINGS)
+    encoding = build_encoding(options)
+    if encoding is not None:
+        encodings.insert(0, encoding)
+    height, width = images[0].shape[:2]
+    log(f"Encoding {len(images)} images ({width}x{height} for the first) in memory:")
+    log(f"{'encoding':<24}{'ms/image':>10}{'KB/image':>10}{'size':>8}{'MP/s':>8}")
+    results = benchmark_encodings(images, encodings)
+    for result in results:
+        log(f"{result['encoding']:<24}{result['ms_per_image']:>10.2f}{result['kb_per_image']:>10.1f}"
+            f"{result['size_ratio']:>8.1%}{result['mpixels_per_s']:>8.1f}")
+    if options["output"]:
+        with open(options["output"], "w") as results_file:
+            json.dump({"input": path, "images": len(images), "results": results}, results_file, indent=2)
+    return 0
+
+
+def run_decode_benchmark(options, stats):
+    """Time the first frames of a video with every available decoder configuration."""
+    from VideoDecoding import probe_decoders
+
+    results = probe_decoders(options["input"], int(options["frames"]))
+    if not results:
+        log(f"No decoder configuration could open {options['input']}")
+        return 1
+    log(f"{'decoder':<36}{'frames/s':>10}  {'backend':<10}{'hardware':<10}")
+    for result in results:
+        log(f"{result['decoding'].describe():<36}{result['fps']:>10.1f}  {result['backend']:<10}"
+            f"{result['hw_acceleration']:<10}")
+    if options["output"]:
+        with open(options["output"], "w") as results_file:
+            json.dump({"input": options["input"],
+                       "results": [{**result, "decoding": result["decoding"].settings()} for result in results]},
+                      results_file, indent=2)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cvhelper", description="Headless CVHelper batch tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser, output=True):
+        subparser.add_argument("--config", help="JSON or YAML file with options for this command")
+        subparser.add_argument("--input", help="Input folder or file")
+        if output:
+            subparser.add_argument("--output", help="Output folder")
+        subparser.add_argument("--quiet", action="store_true", default=None, help="Only print errors")
+        subparser.add_argument("--stats", action="store_true", default=None,
+                               help="Print per-stage timings, throughput and queue depths at the end")
+        subparser.add_argument("--report", help="Write the per-stage timings to this JSON file")
+        subparser.add_argument("--profile", help="Save a cProfile dump of the run to this file")
+
+    def add_encoding(subparser):
+        subparser.add_argument("--format", choices=OUTPUT_FORMATS,
+                               help="Output format: same as the source (default; JPEG for video frames), jpg, png, "
+                                    "webp, bmp (uncompressed) or npy (raw pixel arrays, fastest)")
+        subparser.add_argument("--quality", type=int, help="JPEG and WebP quality 1-100 (above 100: lossless WebP)")
+        subparser.add_argument("--png-compression", dest="png_compression", type=int, choices=range(10),
+                               metavar="0-9", help="PNG compression level, lower is faster and larger")
+        subparser.add_argument("--jpeg-optimize", dest="jpeg_optimize", action="store_true", default=None,
+                               help="Optimise JPEG Huffman tables (slightly smaller, slower)")
+        subparser.add_argument("--jpeg-progressive", dest="jpeg_progressive", action="store_true", default=None,
+                               help="Write progressive JPEGs")
+
+    def add_shards(subparser):
+        subparser.add_argument("--shards", choices=SHARD_FORMATS,
+                               help="Pack the outputs into large tar shards (encoded images) or npy shards "
+                                    "(fixed-size pixel arrays with a labels array) instead of one file each")
+        subparser.add_argument("--shard-mb", dest="shard_mb", type=float,
+                               help=f"Shard size in MB (default {DEFAULT_SHARD_MB})")
+        subparser.add_argument("--shard-size", dest="shard_size", metavar="WxH",
+                               help="Resize images to WxH in npy shards (default: the size of the first image)")
+
+    augment = subparsers.add_parser("augment", help="Augment a folder of images")
+    add_common(augment)
+    augment.add_argument("--rotation", type=int, help="Rotation in degrees (0-180)")
+    augment.add_argument("--flip-lr", dest="flip_lr", action="store_true", default=None, help="Random horizontal flips")
+    augment.add_argument("--flip-tb", dest="flip_tb", action="store_true", default=None, help="Random vertical flips")
+    augment.add_argument("--zoom", type=float, help="Zoom range (0.0-1.0)")
+    augment.add_argument("--shear", type=int, help="Shear in degrees (0-45)")
+    augment.add_argument("--probability", type=float, help="Probability of applying each augmentation")
+    augment.add_argument("--workers", type=int, help="Number of worker processes")
+    augment.add_argument("--seed", type=int, help="Base seed for reproducible results")
+    augment.add_argument("--io-threads", dest="io_threads", type=int,
+                         help="Threads reading ahead and writing behind with one worker (default 4, 0 = off)")
+    augment.add_argument("--variants", type=int, help="Augmented variants written per source image")
+    augment.add_argument("--extensions", help="Comma-separated image extensions to include, e.g. .jpg,.png")
+    augment.add_argument("--recursive", action="store_true", default=None, help="Also augment images in sub-folders")
+    augment.add_argument("--index-cache", dest="index_cache", action="store_true", default=None,
+                         help="Keep a file index so rescanning an unchanged folder is nearly free")
+    augment.add_argument("--resume", action="store_true", default=None,
+                         help="Skip images already augmented with the same settings by an earlier run")
+    add_encoding(augment)
+    add_shards(augment)
+
+    extract = subparsers.add_parser("extract", help="Extract frames from a video or a folder of videos")
+    add_common(extract)
+    extract.add_argument("--start", type=int, help="First frame to extract")
+    extract.add_argument("--end", type=int, help="Frame to stop at (exclusive), defaults to the whole video")
+    extract.add_argument("--resume", action="store_true", default=None,
+                         help="Skip videos already extracted with the same settings by an earlier run")
+    extract.add_argument("--write-threads", dest="write_threads", type=int, help="Number of JPEG encode/write threads")
+    sampling = extract.add_mutually_exclusive_group()
+    sampling.add_argument("--stride", type=int, help="Keep every Nth frame")
+    sampling.add_argument("--target-fps", dest="target_fps", type=float,
+                          help="Keep this many frames per second of video")
+    sampling.add_argument("--interval", type=float, help="Keep one frame every INTERVAL seconds")
+    extract.add_argument("--max-frames", dest="max_frames", type=int, help="Stop after this many frames per video")
+    extract.add_argument("--dedup-threshold", dest="dedup_threshold", type=float,
+                         help="Skip frames that differ from the last kept frame by less than this many percent")
+    extract.add_argument("--video-workers", dest="video_workers", type=int,
+                         help="Extract this many videos of a folder at once, each in its own process")
+    extract.add_argument("--max-memory-mb", dest="max_memory_mb", type=int,
+                         help="Memory budget shared by concurrent extractions")
+    extract.add_argument("--roi", metavar="X,Y,W,H", help="Crop every frame to this region before anything else")
+    resize = extract.add_mutually_exclusive_group()
+    resize.add_argument("--max-side", dest="max_side", type=int,
+                        help="Shrink frames so their longer side is at most this many pixels")
+    resize.add_argument("--resize", dest="size", metavar="WxH", help="Resize frames to exactly WxH")
+    extract.add_argument("--interpolation", choices=tuple(INTERPOLATION_CONSTANTS),
+                         help="Resampling filter for --max-side and --resize (default area)")
+    extract.add_argument("--decoder", choices=(*DECODER_BACKEND_CONSTANTS, "fastest"),
+                         help="Video decoding backend, or fastest to time them all on the first video and pick one")
+    extract.add_argument("--decoder-threads", dest="decoder_threads", type=int,
+                         help="Decoder threads per video (default: the decoder's own choice)")
+    extract.add_argument("--hw-decode", dest="hw_decode", action="store_true", default=None,
+                         help="Decode on the GPU where possible, falling back to the CPU")
+    add_encoding(extract)
+    add_shards(extract)
+
+    sort = subparsers.add_parser("sort", help="Sort images into class folders using _annotations.csv")
+    add_common(sort, output=False)
+    sort.add_argument("--output", help="Create class folders here instead of inside each source folder")
+    sort.add_argument("--mode", choices=SORT_MODES,
+                      help="Move files (default), link or reflink them, only write P<class>.txt index files, "
+                           "or pack them into labelled shards")
+    sort.add_argument("--move-threads", dest="move_threads", type=int,
+                      help="Threads moving files, more helps on network filesystems")
+    add_shards(sort)
+
+    encode_benchmark = subparsers.add_parser("encode-benchmark",
+                                             help="Compare encode time and file size of the output formats")
+    add_common(encode_benchmark, output=False)
+    encode_benchmark.add_argument("--sample", type=int, help="Images (or evenly spaced video frames) to encode")
+    encode_benchmark.add_argument("--output", help="Also write the results to this JSON file")
+    add_encoding(encode_benchmark)
+
+    decode_benchmark = subparsers.add_parser("decode-benchmark",
+                                             help="Compare decoding speed of the video backends and settings")
+    add_common(decode_benchmark, output=False)
+    decode_benchmark.add_argument("--frames", type=int, help="Frames decoded per configuration (default 100)")
+    decode_benchmark.add_argument("--output", help="Also write the results to this JSON file")
+    return parser
+
+
+COMMANDS = {
+    "augment": run_augment,
+    "extract": run_extract,
+    "sort": run_sort,
+    "encode-benchmark": run_encode_benchmark,
+    "decode-benchmark": run_decode_benchmark,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = resolve_options(args)
+    options["quiet"] = bool(options.get("quiet"))
+
+    from Instrumentation import NULL_STATS, RunStats, finish_stats, profiled
+    stats = RunStats(args.command) if options.get("stats") or options.get("report") else NULL_STATS
+    with profiled(options.get("profile")):
+        status = COMMANDS[args.command](options, stats)
+    finish_stats(stats, log, options.get("report"))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import json
+import cv2
+import numpy as np
+import pytest
+from AugmentationCore import apply_affine, augment_folder, build_affine_matrix
+from ImageEncoding import ImageEncoding
+from ShardWriter import ShardFormat
+
+PARAMS = (0, "No", "No", 0.0, 0, 0.5)  # rotation, flip_lr, flip_tb, zoom, shear, probability
+
+
+def chained_augmentation(img, rotation, flip_lr, flip_tb, zoom_factor, shear_factor):
+    """The rotate, flip, zoom and shear steps one after another, as augmentation worked before they were fused."""
+    height, width = img.shape[:2]
+    if rotation:
+        img = cv2.warpAffine(img, cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1), (width, height))
+    if flip_lr:
+        img = cv2.flip(img, 1)
+    if flip_tb:
+        img = cv2.flip(img, 0)
+    if zoom_factor != 1:
+        new_height, new_width = int(height * zoom_factor), int(width * zoom_factor)
+        crop = img[int((height - new_height) / 2):int((height + new_height) / 2),
+                   int((width - new_width) / 2):int((width + new_width) / 2)]
+        img = cv2.resize(crop, (width, height))
+    if shear_factor:
+        img = cv2.warpAffine(img, np.array([[1, shear_factor, 0], [0, 1, 0]], np.float32), (width, height))
+    return img
+
+
+@pytest.mark.parametrize("transform", [(0, True, False, 1, 0), (0, True, True, 1, 0), (30, False, False, 1, 0),
+                                       (0, False, False, 0.8, 0), (0, False, False, 1, 0.2),
+                                       (30, True, True, 0.8, 0.2), (-15, True, False, 0.9, 0.1)])
+def test_build_affine_matrix_matches_the_chained_steps(transform):
+    y, x = np.mgrid[0:120, 0:160]
+    img = np.dstack([x * 1.5, y * 2, x + y]).astype(np.uint8)  # Smooth, so resampling once or twice agrees
+
+    fused = apply_affine(img, build_affine_matrix(160, 120, *transform))
+
+    # The chain loses its corners to the intermediate warps, compare the centre
+    difference = np.abs(fused.astype(int) - chained_augmentation(img, *transform).astype(int))[30:90, 40:120]
+    assert difference.max() <= 1
+
+
+def test_shard_encode_failure_skips_the_image(tmp_path):
+    source, output = tmp_path / "source", tmp_path / "output"
+    source.mkdir()
+    cv2.imwrite(str(source / "small.png"), np.full((16, 16, 3), 128, np.uint8))
+    cv2.imwrite(str(source / "wide.png"), np.zeros((1, 70000, 3), np.uint8))  # Too wide for a JPEG
+
+    results = dict(augment_folder(str(source), str(output), PARAMS, seed=0, encoding=ImageEncoding("jpg"),
+                                  shards=ShardFormat("tar")))
+
+    assert results == {"small.png": True, "wide.png": False}
+    with open(output / "aug.json", encoding="utf-8") as summary_file:
+        summary = json.load(summary_file)
+    assert summary["count"] == 1
+    with open(output / "aug.index.jsonl", encoding="utf-8") as index_file:
+        assert [json.loads(line)["name"] for line in index_file] == ["aug_small.jpg"]
+    assert sorted(os.listdir(output)) == ["aug-000000.tar", "aug.index.jsonl", "aug.json"]
+
+
+def test_resume_skips_finished_images_and_redoes_missing_ones(tmp_path):
+    source, output = tmp_path / "source", tmp_path / "output"
+    source.mkdir()
+    output.mkdir()
+    for name in ("a.png", "b.png", "c.png"):
+        cv2.imwrite(str(source / name), np.full((16, 16, 3), 64, np.uint8))
+
+    def run(seed=0):
+        return dict(augment_folder(str(source), str(output), PARAMS, seed=seed, resume=True))
+
+    assert run() == {"a.png": True, "b.png": True, "c.png": True}
+    assert run() == {"a.png": None, "b.png": None, "c.png": None}
+
+    os.remove(output / "aug_b.png")
+    assert run() == {"a.png": None, "b.png": True, "c.png": None}
+    assert (output / "aug_b.png").exists()
+
+    # Other settings make a different job, nothing of the earlier one counts as done
+    assert run(seed=1) == {"a.png": True, "b.png": True, "c.png": True}
+
+
+def test_seeded_output_does_not_depend_on_the_worker_count(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    rng = np.random.default_rng(0)
+    for number in range(12):
+        cv2.imwrite(str(source / f"{number:02d}.png"), rng.integers(0, 256, (24, 32, 3), np.uint8))
+    params = (20, "Yes", "Yes", 0.1, 10, 0.5)
+
+    outputs = []
+    for workers in (1, 2):
+        output = tmp_path / f"workers{workers}"
+        output.mkdir()
+        results = dict(augment_folder(str(source), str(output), params, workers=workers, seed=7, chunksize=2,
+                                      variants=2))
+        assert all(results.values()) and len(results) == 12
+        outputs.append({name: (output / name).read_bytes() for name in os.listdir(output)})
+
+    assert len(outputs[0]) == 24
+    assert outputs[0] == outputs[1]
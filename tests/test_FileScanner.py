@@ -0,0 +1,39 @@
+import os
+import pytest
+import FileScanner
+from FileScanner import scan_files
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileScanner, "INDEX_CACHE_DIR", str(tmp_path / "cache"))
+    folder = tmp_path / "images"
+    (folder / "sub" / "deeper").mkdir(parents=True)
+    for name in ("a.JPG", "b.png", "notes.txt", "sub/c.jpeg", "sub/deeper/d.webp", "sub/e.gif"):
+        (folder / name).write_bytes(b"")
+    return folder
+
+
+def test_extensions_match_in_any_case(tree):
+    assert sorted(scan_files(str(tree))) == ["a.JPG", "b.png"]
+    assert sorted(scan_files(str(tree), recursive=True)) == ["a.JPG", "b.png", "sub/c.jpeg", "sub/deeper/d.webp"]
+    assert sorted(scan_files(str(tree), "GIF, txt", recursive=True)) == ["notes.txt", "sub/e.gif"]
+    assert sorted(scan_files(str(tree), recursive=True, exclude=(str(tree / "sub" / "deeper"),))) == [
+        "a.JPG", "b.png", "sub/c.jpeg"]
+
+
+def test_cached_index_is_reused_until_a_folder_changes(tree, monkeypatch):
+    expected = ["a.JPG", "b.png", "sub/c.jpeg", "sub/deeper/d.webp"]
+    assert sorted(scan_files(str(tree), recursive=True, cache=True)) == expected
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or scandir(path))
+    assert sorted(scan_files(str(tree), recursive=True, cache=True)) == expected
+    assert listed == []  # Every listing came from the index
+
+    (tree / "sub" / "f.jpg").write_bytes(b"")
+    stat = os.stat(tree / "sub")
+    os.utime(tree / "sub", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))  # Coarse clocks
+    assert sorted(scan_files(str(tree), recursive=True, cache=True)) == sorted(expected + ["sub/f.jpg"])
+    assert listed == [os.path.join(str(tree), "sub")]  # Only the changed folder is listed again
@@ -0,0 +1,19 @@
+from SortImageCore import read_annotations
+
+
+def test_read_annotations_keeps_the_first_class_of_each_image_across_chunks(tmp_path):
+    csv_path = tmp_path / "_annotations.csv"
+    csv_path.write_text("filename,width,height,class,xmin,ymin,xmax,ymax\n"
+                        "a.jpg,10,10,cat,0,0,5,5\n"
+                        "a.jpg,10,10,dog,5,5,9,9\n"
+                        "b.jpg,10,10,dog,0,0,5,5\n"
+                        "c.jpg,10,10,bird,0,0,5,5\n"
+                        "a.jpg,10,10,bird,1,1,4,4\n"
+                        "b.jpg,10,10,cat,1,1,4,4\n"
+                        "d.jpg,10,10,cat,0,0,5,5\n")
+
+    chunks = list(read_annotations(str(csv_path), chunksize=2))
+
+    rows = [(filename, label) for chunk in chunks for filename, label in zip(chunk["filename"], chunk["class"])]
+    assert rows == [("a.jpg", "cat"), ("b.jpg", "dog"), ("c.jpg", "bird"), ("d.jpg", "cat")]
+    assert len(chunks) == 4  # Chunks stay small, a chunk of repeats comes out empty
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import pytest
+from VideoToFramesCore import iter_sampled_frames, sampled_frame_count, sampling_step
+
+
+class FakeCapture:
+    """Stands in for cv2.VideoCapture over frame_count frames, each filled with its own index."""
+
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.position = 0
+        self.seeks = []
+
+    def set(self, prop, value):
+        assert prop == cv2.CAP_PROP_POS_FRAMES
+        self.position = int(value)
+        self.seeks.append(self.position)
+
+    def grab(self):
+        if self.position >= self.frame_count:
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.frame_count:
+            return False, None
+        image = np.full((2, 2), self.position, np.int32)
+        self.position += 1
+        return True, image
+
+
+def sampled_indices(capture, frame_start, frame_end, step, **kwargs):
+    indices = []
+    for index, image in iter_sampled_frames(capture, frame_start, frame_end, step, **kwargs):
+        assert image[0, 0] == index  # The frame yielded is the frame it claims to be
+        indices.append(index)
+    return indices
+
+
+def test_sampling_step_modes():
+    assert sampling_step(30) == 1.0
+    assert sampling_step(30, stride=3) == 3.0
+    assert sampling_step(25, target_fps=10) == 2.5
+    assert sampling_step(30, target_fps=60) == 1.0  # Never more frames than the video has
+    assert sampling_step(30, interval=0.5) == 15.0
+    with pytest.raises(ValueError):
+        sampling_step(30, stride=2, interval=1)
+    with pytest.raises(ValueError):
+        sampling_step(30, target_fps=0)
+
+
+def test_stride_samples_every_nth_frame():
+    capture = FakeCapture(100)
+    indices = sampled_indices(capture, 5, 25, sampling_step(30, stride=3))
+    assert indices == [5, 8, 11, 14, 17, 20, 23]
+    assert len(indices) == sampled_frame_count(5, 25, 3.0)
+    assert capture.seeks == [5]  # Short gaps are walked with grab()
+
+
+def test_target_fps_rounds_fractional_steps():
+    step = sampling_step(25, target_fps=10)
+    indices = sampled_indices(FakeCapture(100), 0, 20, step)
+    assert indices == [0, 2, 5, 8, 10, 12, 15, 18]
+    assert len(indices) == sampled_frame_count(0, 20, step)
+
+
+def test_long_gaps_seek_and_max_frames_stops_early():
+    capture = FakeCapture(1000)
+    indices = sampled_indices(capture, 0, 1000, sampling_step(25, interval=10), max_frames=3, seek_threshold=100)
+    assert indices == [0, 250, 500]
+    assert capture.seeks == [0, 250, 500]
+    assert sampled_frame_count(0, 1000, 250.0, max_frames=3) == 3
+
+
+def test_sampling_stops_at_the_end_of_a_short_video():
+    # The container can report more frames than the decoder delivers
+    assert sampled_indices(FakeCapture(10), 0, 20, 4.0) == [0, 4, 8]